@@ -1,15 +1,54 @@
 import chess
 import chess.engine
 import chess.pgn
+import chess.polyglot
 import io
-import pygame
 import sys
 import os
-import pyperclip
-import re
+import threading
+from top3.core import (
+    analyse_game,
+    evaluate_fen,
+    find_mistakes,
+    format_eval,
+    game_hash,
+    get_player_color,
+    is_endgame,
+    is_pgn_structurally_valid,
+    pgn_parser,
+)
+from top3.background import AnalysisQueue
+from top3.mistakeindex import MistakeIndex
+from top3.progressive import ProgressiveAnalysis
+
+# pygame and pyperclip are only imported once a window is shown (see load_gui)
+pygame = None
+pyperclip = None
 
 #Stockfish Path
 STOCKFISH_PATH = "C:/Users/johnb/Documents/Apps/stockfish/stockfish-windows-x86-64-avx2.exe"
+# Stockfish processes a pasted game is split across (one per two cores, at most 8)
+ANALYSIS_ENGINES = max(1, min(8, (os.cpu_count() or 2) // 2))
+# Open the menu after a quick first pass and refine the mistakes in the background
+PROGRESSIVE_ANALYSIS = True
+# Otherwise, seconds a pasted game may take (None: 0.6 s per move)
+ANALYSIS_DEADLINE = None
+# Per-user folder for data kept between runs
+DATA_DIR = os.path.join(
+    os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_DATA_HOME")
+    or os.path.join(os.path.expanduser("~"), ".local", "share"),
+    "top3-chess-mistakes",
+)
+# Mistakes of every reviewed game are kept here to spot recurring ones (None to turn off)
+MISTAKE_INDEX_PATH = os.path.join(DATA_DIR, "mistakes.idx")
+# Characters of a paste inserted into the PGN box per frame
+PASTE_CHUNK_SIZE = 4096
+# Pastes holding several games are analysed in the background instead of filling the PGN box
+MULTI_GAME_PASTE = True
+# Background queue for multi-game pastes, shared by every start_window
+background_queue = None
+# MistakeIndex at MISTAKE_INDEX_PATH, shared by the review screen and the background queue
+shared_mistake_index = None
 
 # Board and piece image settings
 os.environ['SDL_VIDEO_CENTERED'] = '1' #Centre all window screens
@@ -20,14 +59,25 @@ SIDE_PANEL_WIDTH = BOARD_SIZE  # 100% extension
 WINDOW_WIDTH = BOARD_SIZE + SIDE_PANEL_WIDTH
 WINDOW_HEIGHT = BOARD_SIZE + 2 * EXTRA_HEIGHT
 PIECE_IMAGES = {}
+SPRITE_CACHE_DIR = None  # Optional folder to keep the scaled piece atlas between runs
+
+def load_gui():
+    """
+    Imports pygame and pyperclip the first time a screen is shown, so importing this
+    module (or the top3 package) never initialises SDL.
+    """
+    global pygame, pyperclip
+    if pygame is None:
+        import pygame
+        import pyperclip
 
 def load_piece_images():
-    pieces = ['r', 'n', 'b', 'q', 'k', 'p']
-    colors = ['w', 'b']
-    for color in colors:
-        for piece in pieces:
-            img = pygame.image.load(f"assets/{color}{piece}.png")
-            PIECE_IMAGES[color + piece] = pygame.transform.scale(img, (SQUARE_SIZE, SQUARE_SIZE))
+    """
+    Fills PIECE_IMAGES from the sprite atlas for SQUARE_SIZE, which is only
+    loaded and scaled the first time (see top3.sprites).
+    """
+    from top3 import sprites
+    PIECE_IMAGES.update(sprites.piece_images(SQUARE_SIZE, cache_dir=SPRITE_CACHE_DIR))
 
 def draw_board(screen, board, player_color="white"):
     """
@@ -60,231 +110,167 @@ def draw_board(screen, board, player_color="white"):
             display_rank = rank if player_color == "white" else 7 - rank
             screen.blit(img, (display_file * SQUARE_SIZE, (7 - display_rank) * SQUARE_SIZE))
 
-def evaluate_fen(fen, engine, turn):
-    board = chess.Board(fen)
-    info = engine.analyse(board, chess.engine.Limit(time=0.1))
-    score = info["score"]
-    # Use .white() or .black() based on whose turn it is
-    if turn == chess.WHITE:
-        s = score.white()
-    else:
-        s = score.black()
-    if s.is_mate():
-        return f"# {s.mate()}"
-    return s.score() / 100
-def is_endgame(board):
+class LiveAnalysis:
     """
-    Returns "yes" if both sides have 2 or fewer minor/major pieces (not counting pawns/kings), else "no".
+    Keeps one infinite engine search running for the position on the review board.
+    The search is only restarted when the position changes, so depth keeps growing
+    while the user looks at a position, and reading the latest results never blocks.
     """
-    minor_major = [chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT]
-    white_material = sum(len(board.pieces(pt, chess.WHITE)) for pt in minor_major)
-    black_material = sum(len(board.pieces(pt, chess.BLACK)) for pt in minor_major)
-    return "yes" if (white_material <= 2 and black_material <= 2) else "no"
-
-
-def get_player_color(pgn_string, username):
+    def __init__(self, engine, player_color, multipv=3):
+        self.engine = engine
+        self.turn = chess.WHITE if player_color == "white" else chess.BLACK
+        self.multipv = multipv
+        self.key = None
+        self.board = None
+        self.analysis = None
+
+    def update(self, board, key=None):
+        """
+        Starts a new search if board differs from the position being analysed.
+        key is the board's Zobrist hash if the caller already knows it.
+        """
+        if key is None:
+            key = chess.polyglot.zobrist_hash(board)
+        if self.analysis is not None and key == self.key:
+            return
+        self.stop()
+        self.key = key
+        self.board = board.copy(stack=False)
+        self.analysis = self.engine.analysis(self.board, multipv=self.multipv)
+
+    def stop(self):
+        """Stops the running search, e.g. before navigating away from the board."""
+        if self.analysis is not None:
+            self.analysis.stop()
+            self.analysis = None
+        self.key = None
+
+    def snapshot(self):
+        """
+        Returns (depth, current_eval, lines) for the deepest results received so far.
+        current_eval is formatted like evaluate_fen, or None before the first result.
+        lines is a list of (pv, white_score) tuples, best line first.
+        """
+        if self.analysis is None:
+            return None, None, []
+        depth = None
+        current_eval = None
+        lines = []
+        for pv_info in self.analysis.multipv:
+            if "score" not in pv_info:
+                continue
+            if current_eval is None:
+                depth = pv_info.get("depth")
+                current_eval = format_eval(pv_info["score"], self.turn)
+            if pv_info.get("pv"):
+                lines.append((pv_info["pv"], pv_info["score"].white().score(mate_score=10000)))
+        return depth, current_eval, lines
+
+class MoveIndex:
     """
-    Returns 'white' or 'black' depending on which color the username played in the PGN.
-    If username not found, returns None.
+    Caches, for the position on the interactive board, the legal moves grouped by
+    from-square and the SAN text of engine lines, keyed by the position's Zobrist hash.
+    Call invalidate() whenever a move is pushed or popped or another board is shown;
+    everything else is served from the cache, independent of the frame rate.
     """
-    game = chess.pgn.read_game(io.StringIO(pgn_string))
-    white = game.headers.get("White", "").strip().lower()
-    black = game.headers.get("Black", "").strip().lower()
-    username_lower = username.strip().lower()
-    if username_lower == white:
-        return "white"
-    elif username_lower == black:
-        return "black"
-    else:
-        return None
-
-def pgn_parser(pgn_string):
-    # First, check PGN structure before move legality
-    structure_valid, structure_message = is_pgn_structurally_valid(pgn_string)
-    if not structure_valid:
-        return False, structure_message
-    # Remove header lines and join move text
-    lines = pgn_string.strip().split('\n')
-    move_lines = [line for line in lines if not line.startswith('[')]
-    move_text = ' '.join(move_lines)
-    # Remove result (e.g. 1-0, 0-1, 1/2-1/2)
-    move_text = re.sub(r"\d-\d|\d/\d-\d/\d", "", move_text)
-    # Remove comments and NAGs
-    move_text = re.sub(r"\{[^}]*\}", "", move_text)
-    move_text = re.sub(r"\$\d+", "", move_text)
-    # Split into tokens
-    tokens = move_text.split()
-    # Remove move numbers
-    moves = [tok for tok in tokens if not re.match(r"^\d+\.*$", tok)]
-    board = chess.Board()
-    old_stderr = sys.stderr
-    sys.stderr = io.StringIO()
-    try:
-        for idx, san in enumerate(moves):
-            found_move = None
+    def __init__(self):
+        self.current = None
+        self.moves_by_square = {}
+        self.pv_sans = {}
+
+    def invalidate(self):
+        self.current = None
+
+    def key(self, board):
+        """Returns the Zobrist hash of board, only recomputing it after invalidate()."""
+        if self.current is None:
+            self.current = chess.polyglot.zobrist_hash(board)
+            self.moves_by_square = {}
+            self.pv_sans = {}
             for move in board.legal_moves:
-                try:
-                    if board.san(move) == san:
-                        found_move = move
-                        break
-                except Exception:
-                    continue
-            if found_move:
-                board.push(found_move)
-            else:
-                move_number = board.fullmove_number
-                side = "White" if board.turn == chess.WHITE else "Black"
-                move_prefix = f"{move_number}." if board.turn == chess.WHITE else f"{move_number}..."
-                return False, f"Illegal move {move_prefix} {san} ({side})"
-        return True, None
-    finally:
-        sys.stderr = old_stderr  # Always restore stderr after all parsing
-def is_pgn_structurally_valid(pgn_string):
+                self.moves_by_square.setdefault(move.from_square, []).append(move)
+        return self.current
+
+    def legal_moves_from(self, board, square):
+        self.key(board)
+        return self.moves_by_square.get(square, [])
+
+    def pv_san(self, board, pv, length=6):
+        """Returns the SAN strings of the first length moves of pv played from board."""
+        self.key(board)
+        pv = tuple(pv[:length])
+        if pv not in self.pv_sans:
+            pv_board = board.copy(stack=False)
+            pv_moves = []
+            for m in pv:
+                pv_moves.append(pv_board.san(m))
+                pv_board.push(m)
+            self.pv_sans[pv] = pv_moves
+        return self.pv_sans[pv]
+
+class PasteBuffer:
     """
-    Checks if the PGN string has a valid structure:
-    - Contains at least required headers ([Event], [Site], [Date], [White], [Black])
-    - Headers are in correct format ([Key "Value"])
-    - Contains at least one move in valid SAN notation
-    - Does not look like plain text or random input
-    Returns (True, None) if valid, (False, error_message) if not.
+    Reads the clipboard on a worker thread and hands the text back in chunks of
+    chunk_size characters, one per frame, so pasting a huge PGN never blocks the window.
+    With multi_game a paste holding more than one game is handed back whole as games
+    instead, for the background queue.
     """
+    def __init__(self, chunk_size=PASTE_CHUNK_SIZE, multi_game=MULTI_GAME_PASTE):
+        self.chunk_size = chunk_size
+        self.multi_game = multi_game
+        self.thread = None
+        self.text = None
+        self.games = None
+        self.position = 0
+
+    @property
+    def busy(self):
+        return self.thread is not None
+
+    def start(self):
+        """Starts reading the clipboard, unless a paste is still being inserted."""
+        if self.busy:
+            return
+        self.thread = threading.Thread(target=self._fetch, daemon=True)
+        self.thread.start()
+
+    def _fetch(self):
+        try:
+            text = pyperclip.paste() or ""
+        except Exception:
+            text = ""
+        text = text.replace("\r\n", "\n")
+        self.position = 0
+        if self.multi_game and text.count("[Event ") > 1:
+            self.games = text
+        else:
+            self.text = text
+
+    def poll(self):
+        """
+        Returns (chunk, games): the next piece of text to insert ("" if none) and a
+        multi-game paste to queue (None if none).
+        """
+        if self.thread is None or self.thread.is_alive():
+            return "", None
+        if self.games is not None:
+            games, self.games = self.games, None
+            self.thread = None
+            return "", games
+        chunk = self.text[self.position:self.position + self.chunk_size]
+        self.position += self.chunk_size
+        if self.position >= len(self.text):
+            self.text = None
+            self.thread = None
+        return chunk, None
 
-    # 1. Check for required headers and malformed headers
-    required_headers = ["Event", "Site", "Date", "White", "Black"]
-    headers_found = {h: False for h in required_headers}
-    header_pattern = re.compile(r'^\[(\w+)\s+"(.*)"\]$')
-    lines = pgn_string.strip().splitlines()
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        # Simple error message for header issues
-        #if not line.startswith('[')  and any(h in line for h in required_headers):
-            #return False, f"PGN Header Error: Missing opening bracket in header: {line}"
-        # Check for unclosed bracket or quote in header lines
-        if line.startswith('['):
-            if not line.endswith(']'):
-                return False, "PGN Structure Error"
-            if line.count('"') % 2 != 0:
-                return False, "PGN Structure Error"
-            m = header_pattern.match(line)
-            if m:
-                key = m.group(1)
-                if key in headers_found:
-                    headers_found[key] = True
-        elif line and not line.startswith('['):
-            break  # Stop checking headers once moves start
-
-    missing = [h for h, found in headers_found.items() if not found]
-    if missing:
-        return False, "PGN Structure Error"
-
-    # 2. Check for at least one move in SAN notation
-    move_lines = [line for line in lines if not line.startswith('[') and line.strip()]
-    move_text = ' '.join(move_lines)
-    # Remove result
-    move_text = re.sub(r"\d-\d|\d/\d-\d/\d", "", move_text)
-    # Remove comments and NAGs
-    move_text = re.sub(r"\{[^}]*\}", "", move_text)
-    move_text = re.sub(r"\$\d+", "", move_text)
-    # Split into tokens
-    tokens = move_text.split()
-    # Remove move numbers
-    moves = [tok for tok in tokens if not re.match(r"^\d+\.*$", tok)]
-    # Remove result tokens
-    moves = [tok for tok in moves if tok not in ["1-0", "0-1", "1/2-1/2", "*"]]
-
-    # Basic SAN move pattern: e4, Nf3, Qxe5, O-O, O-O-O, etc.
-    san_pattern = re.compile(r"^(O-O(-O)?|[KQRBN]?[a-h]?[1-8]?x?[a-h][1-8](=[QRBN])?|[a-h][1-8])[\+#=]?$")
-    valid_moves = [m for m in moves if san_pattern.match(m)]
-    if not valid_moves:
-        return False, "PGN Structure Error"
-
-    # 3. Check for plain text (e.g., "hello world" or random text)
-    if len(valid_moves) < max(1, len(moves) // 2):
-        return False, "PGN Structure Error"
-
-    return True, None
-def find_mistakes(pgn_string, color,stockfish_path):
-    """
-    Returns a dictionary of mistakes for the given color.
-    The dictionary has keys: 'all', 'opening', 'middlegame', 'endgame'.
-    Each value is a list of tuples: (move_number, move, evaluation, change_in_eval)
-    A mistake is any move that reduces evaluation by 0.2 or more,
-    but NOT if the move is the engine's best move.
-    The lists are sorted by the largest negative change in evaluation (worst mistakes first).
-    """
-    game = chess.pgn.read_game(io.StringIO(pgn_string))
-    board = game.board()
-    mistakes = {
-        "all": [],
-        "opening": [],
-        "middlegame": [],
-        "endgame": []
-    }
-    prev_eval = 0
-    color = color.lower()
-    total_penalty=0
-    move_number = 0
-    with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-        for move in game.mainline_moves():
-            move_number = board.fullmove_number
-            side = "white" if board.turn else "black"
-            move_san = board.san(move)
-            #Get the best move from the engine for this position
-            info = engine.analyse(board, chess.engine.Limit(time=0.5))
-            best_move = info.get("pv", [None])[0]
-            #Only record as mistake if move is NOT the best move
-            if best_move is not None and move == best_move:
-                board.push(move)
-                try:
-                    prev_eval = float(evaluate_fen(board.fen(), engine, chess.WHITE if color == "white" else chess.BLACK))
-                except Exception:
-                    prev_eval = 0
-                continue
-            is_endgame_phase = is_endgame(board)
-            board.push(move)
-            #Always evaluate from the specified color's perspective
-            eval_turn = chess.WHITE if color == "white" else chess.BLACK
-            eval_score = evaluate_fen(board.fen(), engine, eval_turn)
-            if side == color:
-                try:
-                    eval_float = float(eval_score)
-                    prev_float = float(prev_eval)
-                    change = eval_float - prev_float
-                    
-                    if change < -0.2:
-                        #mistake found and recorded
-                        total_penalty += abs(max(change,-1))
-                        mistakes["all"].append((move_number, move_san, eval_score, change))
-                        #mistake based on game stage
-                        if move_number <= 10:
-                            mistakes["opening"].append((move_number, move_san, eval_score, change))
-                        elif is_endgame_phase == "yes":
-                            mistakes["endgame"].append((move_number, move_san, eval_score, change))
-                        else:
-                            mistakes["middlegame"].append((move_number, move_san, eval_score, change))
-                except Exception:
-                    pass  # skip mate scores or errors
-            try:
-                prev_eval = float(eval_score)
-            except Exception:
-                prev_eval = 0
-    # Sort each list by the largest negative change (worst first)
-    for key in mistakes:
-        mistakes[key].sort(key=lambda x: x[3])
-        mistakes[key] = mistakes[key][:3]  # Keep only the top 3 mistakes
-    if move_number!=0:
-        accuracy = max(0.0, 1 - (total_penalty / move_number))
-    else:
-        accuracy = 1.0
-    return mistakes, accuracy
 def start_window(username, stockfish_path):
     """
     Displays a Pygame window with a title and a text box for the user to paste or type a PGN string.
     Returns the entered PGN string when the user presses Enter.
     Supports vertical scrolling if the text exceeds the input box height.
     """
+    load_gui()
     pygame.init()
     menu_width, menu_height = 700, 350
     screen = pygame.display.set_mode((menu_width, menu_height))
@@ -341,6 +327,10 @@ def start_window(username, stockfish_path):
             loading_font = pygame.font.SysFont(None, 44)
             loading_text = loading_font.render("Analyzing game, please wait...", True, (220, 220, 220))
             screen.blit(loading_text, ((menu_width - loading_text.get_width()) // 2, menu_height // 2 - 22))
+            if ANALYSIS_DEADLINE and not PROGRESSIVE_ANALYSIS:
+                wait_font = pygame.font.SysFont(None, 28)
+                wait_text = wait_font.render(f"About {ANALYSIS_DEADLINE:g} seconds (longer on a slow machine)", True, (160, 160, 160))
+                screen.blit(wait_text, ((menu_width - wait_text.get_width()) // 2, menu_height // 2 + 22))
             pygame.display.flip()
             try:
                 is_valid, message = pgn_parser(text)
@@ -353,9 +343,17 @@ def start_window(username, stockfish_path):
                         error_message = f"Username '{username}' not found in PGN."
                         loading = False
                     else:
-                        mistakes, accuracy = find_mistakes(text, color, stockfish_path)
+                        if PROGRESSIVE_ANALYSIS:
+                            game = chess.pgn.read_game(io.StringIO(text))
+                            progress = ProgressiveAnalysis(game, color, stockfish_path).start()
+                            mistakes, accuracy = progress.result()
+                        else:
+                            progress = None
+                            mistakes, accuracy = find_mistakes(
+                                text, color, stockfish_path, ANALYSIS_ENGINES, ANALYSIS_DEADLINE
+                            )
                         loading = False
-                        mainmenu(text, color, stockfish_path, mistakes, accuracy)
+                        mainmenu(text, color, stockfish_path, mistakes, accuracy, progress)
             except Exception:
                 error_message = "Invalid PGN entered. Please check your input."
                 loading = False
@@ -369,10 +367,19 @@ def start_window(username, stockfish_path):
 
     error_message = None
 
+    global background_queue
+    paste = PasteBuffer()
+    status_font = pygame.font.SysFont(None, 24)
+    # Lines and widths of text, measured again only when text changes
+    measured_text = None
+    lines = [""]
+    max_line_pixel_width = 0
+    input_box_inner_width = input_box.width - 10  # 5px padding on each side
 
     while not done:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                stop_background_queue()
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -385,7 +392,6 @@ def start_window(username, stockfish_path):
                 if (input_box.right <= event.pos[0] <= input_box.right + 15 and
                     input_box.top <= event.pos[1] <= input_box.bottom):
                     # Calculate line based on click position
-                    lines = text.split('\n')
                     total_lines = len(lines)
                     if total_lines > max_visible_lines:
                         rel_y = event.pos[1] - input_box.top
@@ -405,12 +411,7 @@ def start_window(username, stockfish_path):
                 if active:
                     # Handle Ctrl+V for paste
                     if (event.key == pygame.K_v and (pygame.key.get_mods() & pygame.KMOD_CTRL)):
-                        try:
-                            clip_text = pyperclip.paste()
-                            if clip_text:
-                                text += clip_text
-                        except Exception:
-                            pass
+                        paste.start()
                     elif event.key == pygame.K_RETURN:
                         done = True
                         handle_pgn_entry(text, username, stockfish_path, screen, menu_width, menu_height)#PGN Entered
@@ -419,8 +420,7 @@ def start_window(username, stockfish_path):
                     elif event.key == pygame.K_UP:
                         scroll_offset = max(0, scroll_offset - 1)#scroll up
                     elif event.key == pygame.K_DOWN:
-                        lines = text.split('\n')#scro;; down
-                        total_lines = len(lines)
+                        total_lines = len(lines)#scroll down
                         scroll_offset = min(max(0, total_lines - max_visible_lines), scroll_offset + 1)
                     elif event.key == pygame.K_LEFT:
                         horiz_scroll_offset = max(0, horiz_scroll_offset - 20)#scroll left
@@ -432,6 +432,18 @@ def start_window(username, stockfish_path):
                             text += event.unicode
         if done:#window no longer active
             break
+        # Insert one chunk of a paste per frame; several games go to the background queue
+        chunk, games = paste.poll()
+        if chunk:
+            text += chunk
+        if games:
+            if background_queue is None:
+                background_queue = AnalysisQueue(stockfish_path, username, get_mistake_index())
+            background_queue.put_text(games)
+        if text is not measured_text:
+            lines = text.split('\n')
+            max_line_pixel_width = max((input_font.size(line)[0] for line in lines), default=0)
+            measured_text = text
         screen.fill((40, 40, 40))#build window
         title = title_font.render("Top 3 Chess Mistakes", True, (220, 220, 220))
         screen.blit(title, ((menu_width - title.get_width()) // 2, 30))
@@ -442,11 +454,8 @@ def start_window(username, stockfish_path):
         pygame.draw.rect(screen, color, input_box, 3)
 
         # Render the current text (multi-line support with vertical and horizontal scrolling)
-        lines = text.split('\n')
         total_lines = len(lines)
         visible_lines = lines[scroll_offset:scroll_offset + max_visible_lines]
-        # Use the longest line in ALL lines for horizontal scroll
-        max_line_len = max((len(line) for line in lines), default=0)
         for i, line in enumerate(visible_lines):
             # Horizontal scroll: show only the visible part of the line
             display_line = line
@@ -484,8 +493,6 @@ def start_window(username, stockfish_path):
             pygame.draw.rect(screen, (180, 180, 180), (scrollbar_x, handle_y, scrollbar_w, handle_h), border_radius=5)
 
         # Draw horizontal scrollbar if needed (pixel-based)
-        max_line_pixel_width = max((input_font.size(line)[0] for line in lines), default=0)
-        input_box_inner_width = input_box.width - 10  # 5px padding on each side
         if max_line_pixel_width > input_box_inner_width:
             hscroll_x = input_box.left
             hscroll_y = input_box.bottom + 3
@@ -509,17 +516,34 @@ def start_window(username, stockfish_path):
             )
         )
 
+        # Paste and background analysis status
+        status = None
+        if paste.busy:
+            status = "Pasting..."
+        elif background_queue is not None and background_queue.error:
+            status = f"Background analysis failed: {background_queue.error}"
+        elif background_queue is not None:
+            status = f"Background analysis: {background_queue.done}/{background_queue.queued} games"
+            if background_queue.skipped:
+                status += f", {background_queue.skipped} skipped"
+        if status:
+            status_surface = status_font.render(status, True, (160, 160, 160))
+            screen.blit(status_surface, ((menu_width - status_surface.get_width()) // 2, enter_button_rect.bottom + 12))
+
         pygame.display.flip()
 
     pygame.display.quit()
     pygame.quit()
 
-def mainmenu(pgn_string, color, stockfish_path, mistakes,accuracy):
+def mainmenu(pgn_string, color, stockfish_path, mistakes,accuracy, progress=None):
     """
     Displays a Pygame window with a title and up to four vertically aligned buttons:
     'All Game', 'Opening', 'Middlegame', and 'Endgame'.
     Only shows buttons for mistake types that exist.
+    With progress (a top3.progressive.ProgressiveAnalysis still refining), the buttons
+    and accuracy are updated whenever the analysis improves.
     """
+    load_gui()
     pygame.init()
     menu_width, menu_height = 400, 520
     screen = pygame.display.set_mode((menu_width, menu_height))
@@ -528,32 +552,6 @@ def mainmenu(pgn_string, color, stockfish_path, mistakes,accuracy):
     font = pygame.font.SysFont(None, 36)
     button_font = pygame.font.SysFont(None, 32)
 
-    # Create button definitions for each available mistake type
-    button_defs = []
-    if mistakes["all"]:
-        button_defs.append((f"All Game: {len(mistakes['all'])}", "all"))
-    if mistakes["opening"]:
-        button_defs.append((f"Opening: {len(mistakes['opening'])}", "opening"))
-    if mistakes["middlegame"]:
-        button_defs.append((f"Middlegame: {len(mistakes['middlegame'])}", "middlegame"))
-    if mistakes["endgame"]:
-        button_defs.append((f"Endgame: {len(mistakes['endgame'])}", "endgame"))
-
-    button_w, button_h = 200, 60
-    button_spacing = 25
-    start_y = 140
-    button_rects = []
-
-    # Create rectangles for each button
-    for i, (label, key) in enumerate(button_defs):
-        rect = pygame.Rect(
-            (menu_width - button_w) // 2,
-            start_y + i * (button_h + button_spacing),
-            button_w,
-            button_h
-        )
-        button_rects.append((rect, label, key))
-
     # Create a back button at the bottom left
     back_button_width = int(98)
     back_button_height = int(31.5)
@@ -562,20 +560,58 @@ def mainmenu(pgn_string, color, stockfish_path, mistakes,accuracy):
     back_button_rect = pygame.Rect(back_button_x, back_button_y, back_button_width, back_button_height)
     back_button_font = pygame.font.SysFont(None, 23)
     back_button_text = back_button_font.render("Back", True, (255, 255, 255))
-
-    # Prepare accuracy display
     accuracy_font = pygame.font.SysFont(None, 32)
-    accuracy_value = accuracy * 100
-    if accuracy_value >= 80:
-        accuracy_color = (80, 220, 80)
-    elif accuracy_value >= 75:
-        accuracy_color = (255, 180, 80)
-    else:
-        accuracy_color = (220, 80, 80)
-    accuracy_text = f"Accuracy: {accuracy_value:.1f}%"
+    progress_font = pygame.font.SysFont(None, 22)
+
+    def layout(mistakes, accuracy):
+        """Button rectangles and accuracy display for the current mistakes."""
+        # Create button definitions for each available mistake type
+        button_defs = []
+        if mistakes["all"]:
+            button_defs.append((f"All Game: {len(mistakes['all'])}", "all"))
+        if mistakes["opening"]:
+            button_defs.append((f"Opening: {len(mistakes['opening'])}", "opening"))
+        if mistakes["middlegame"]:
+            button_defs.append((f"Middlegame: {len(mistakes['middlegame'])}", "middlegame"))
+        if mistakes["endgame"]:
+            button_defs.append((f"Endgame: {len(mistakes['endgame'])}", "endgame"))
+
+        button_w, button_h = 200, 60
+        button_spacing = 25
+        start_y = 140
+        button_rects = []
+
+        # Create rectangles for each button
+        for i, (label, key) in enumerate(button_defs):
+            rect = pygame.Rect(
+                (menu_width - button_w) // 2,
+                start_y + i * (button_h + button_spacing),
+                button_w,
+                button_h
+            )
+            button_rects.append((rect, label, key))
+
+        # Prepare accuracy display
+        accuracy_value = accuracy * 100
+        if accuracy_value >= 80:
+            accuracy_color = (80, 220, 80)
+        elif accuracy_value >= 75:
+            accuracy_color = (255, 180, 80)
+        else:
+            accuracy_color = (220, 80, 80)
+        accuracy_text = f"Accuracy: {accuracy_value:.1f}%"
+        return button_rects, accuracy_text, accuracy_color
+
+    button_rects, accuracy_text, accuracy_color = layout(mistakes, accuracy)
+    seen_version = None
 
     running = True
     while running:
+        # Pick up refined results from the background analysis
+        if progress is not None and progress.version != seen_version:
+            seen_version = progress.version
+            mistakes, accuracy = progress.result()
+            button_rects, accuracy_text, accuracy_color = layout(mistakes, accuracy)
         screen.fill((40, 40, 40))
         # Draw the main title
         title = title_font.render("Top 3 Chess Mistakes", True, (220, 220, 220))
@@ -589,6 +625,13 @@ def mainmenu(pgn_string, color, stockfish_path, mistakes,accuracy):
         subtitle = font.render("Analyze mistakes for:", True, (200, 200, 200))
         screen.blit(subtitle, ((menu_width - subtitle.get_width()) // 2, 110))
 
+        # Show refinement progress while the background analysis is running
+        if progress is not None and not progress.finished:
+            status = progress_font.render(
+                f"Refining {progress.refined}/{len(progress.candidates)}...", True, (160, 160, 160)
+            )
+            screen.blit(status, (menu_width - status.get_width() - 20, menu_height - status.get_height() - 18))
+
         # Draw all available mistake type buttons
         for rect, label, key in button_rects:
             pygame.draw.rect(screen, (80, 80, 80), rect, border_radius=10)
@@ -609,27 +652,64 @@ def mainmenu(pgn_string, color, stockfish_path, mistakes,accuracy):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+                if progress is not None:
+                    progress.stop()
+                stop_background_queue()
             elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 mx, my = event.pos
                 for rect, label, key in button_rects:
                     if rect.collidepoint(mx, my):
                         running = False
-                        show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path, key, mistakes,accuracy)
+                        show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path, key, mistakes,accuracy, progress)
                 if back_button_rect.collidepoint(mx, my):
                     running = False
+                    if progress is not None:
+                        progress.stop()
                     # Go back to start window
                     start_window(username, stockfish_path)
                     return
 
     pygame.display.quit()
     pygame.quit()
-def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,mistakes_set,accuracy):
+def get_mistake_index():
+    """The MistakeIndex at MISTAKE_INDEX_PATH, opened once and shared; None if turned off."""
+    global shared_mistake_index
+    if shared_mistake_index is None and MISTAKE_INDEX_PATH:
+        shared_mistake_index = MistakeIndex(MISTAKE_INDEX_PATH)
+    return shared_mistake_index
+
+def stop_background_queue():
+    """Stops the background analysis of pasted games and quits its engine, on exit."""
+    global background_queue
+    if background_queue is not None:
+        background_queue.stop()
+        background_queue = None
+
+def mistake_boards(game, color, mistakes):
+    """
+    Returns (board before the move, move, change in eval) for each of color's mistakes,
+    given as (move_number, move, evaluation, change) tuples like find_mistakes returns.
+    """
+    wanted = {(move_number, move_san): change for move_number, move_san, eval_score, change in mistakes}
+    result = []
+    board = game.board()
+    for move in game.mainline_moves():
+        side = "white" if board.turn == chess.WHITE else "black"
+        if side == color:
+            found = (board.fullmove_number, board.san(move))
+            if found in wanted:
+                result.append((board.copy(stack=False), move, wanted[found]))
+        board.push(move)
+    return result
+
+def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,mistakes_set,accuracy, progress=None):
     """
     Shows the board at the first 3 mistakes in the sorted mistake list for the given color,
     and highlights the from-square and to-square of the mistake move.
     Use left/right arrow keys or 'a'/'d' to move between mistakes.
     You can interact with the pieces to make legal moves after a mistake; going back resets to the mistake position.
     """
+    load_gui()
     pygame.init()
     screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
     pygame.display.set_caption("Board at Mistakes")
@@ -656,11 +736,25 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
             side = "white" if board.turn == chess.WHITE else "black"
             if san == move_san and current_move_number == move_number and side == color:
                 mistake_move = move
-                prev_mistake_positions.append((board.copy()))
+                # Keep only the last move of each copy (for highlighting), not the whole game
+                prev_mistake_positions.append((board.copy(stack=1)))
                 board.push(move)
                 break
             board.push(move)
-        mistake_positions.append((board.copy(), mistake_move, move_number, move_san, eval_score, change))
+        mistake_positions.append((board.copy(stack=1), mistake_move, move_number, move_san, eval_score, change))
+
+    # Remember this game's mistakes, and count other games with a mistake in a similar position
+    similar_counts = []
+    mistake_index = get_mistake_index()
+    if mistake_index is not None:
+        key = game_hash(game)
+        # A game still being refined is indexed on a later visit, once its mistakes are final.
+        # Without its record only the top 3 are known; a batch run can add the rest later.
+        if progress is None:
+            mistake_index.add_game(key, mistake_boards(game, color, mistakes_set["all"]))
+        elif progress.complete:
+            mistake_index.add_record(progress.record, key)
+        similar_counts = [mistake_index.other_games(board_before, key) for board_before in prev_mistake_positions]
     # Highlight color for move squares
     highlight_square = pygame.Color(210, 180, 140, 90)  # light brown (tan), semi-transparent
 
@@ -955,17 +1049,17 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
                     img,
                     (display_file * SQUARE_SIZE, EXTRA_HEIGHT + (7 - display_rank) * SQUARE_SIZE)
                 )
-        # Evaluate the current board for display
-        with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-            eval_turn = chess.WHITE if player_color == "white" else chess.BLACK
-            current_eval = evaluate_fen(board.fen(), engine, eval_turn)
-
-            eval_value_font = pygame.font.SysFont(None, 28)
+        # Read the latest results of the live analysis for display
+        live.update(board, move_index.key(board))
+        depth, current_eval, pv_lines = live.snapshot()
+        eval_value_font = pygame.font.SysFont(None, 28)
         try:
             eval_float = float(current_eval)
             eval_value_str = f"{eval_float:.2f}"
         except Exception:
-            eval_value_str = str(current_eval)
+            eval_value_str = "..." if current_eval is None else str(current_eval)
+        if depth is not None:
+            eval_value_str += f"  (depth {depth})"
         eval_value_surface = eval_value_font.render(eval_value_str, True, (255, 255, 255))
         screen.blit(
             eval_value_surface,
@@ -974,19 +1068,10 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
         # Show best 3 lines for current position below the evaluation line
         best_lines = []
         try:
-            with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-                info = engine.analyse(board, chess.engine.Limit(time=0.5), multipv=3)
-                for i, pv_info in enumerate(info):
-                    pv = pv_info.get("pv")
-                    if pv:
-                        pv_board = board.copy()
-                        pv_moves = []
-                        for m in pv[:6]:
-                            pv_moves.append(pv_board.san(m))
-                            pv_board.push(m)
-                        pv_score = pv_info["score"].white().score(mate_score=10000)
-                        pv_text = f"{i+1}: {' '.join(pv_moves)} (Eval: {pv_score/100 if pv_score < 10000 else '#'} )"
-                        best_lines.append(pv_text)
+            for i, (pv, pv_score) in enumerate(pv_lines):
+                pv_moves = move_index.pv_san(board, pv)
+                pv_text = f"{i+1}: {' '.join(pv_moves)} (Eval: {pv_score/100 if pv_score < 10000 else '#'} )"
+                best_lines.append(pv_text)
         except ValueError:
           print('Error with lines')
 
@@ -1074,6 +1159,18 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
         if return_button_rect.collidepoint(pygame.mouse.get_pos()):
             pygame.draw.rect(screen, (80, 160, 80), return_button_rect, border_radius=8)
 
+        # Show how many other games had a mistake in a similar position
+        if idx < len(similar_counts) and similar_counts[idx]:
+            count = similar_counts[idx]
+            similar_font = pygame.font.SysFont(None, 24)
+            similar_surface = similar_font.render(
+                f"You made a similar error in {count} other game{'s' if count != 1 else ''}", True, (255, 180, 80)
+            )
+            screen.blit(
+                similar_surface,
+                (return_button_rect.right + 20, return_button_rect.centery - similar_surface.get_height() // 2)
+            )
+
         # Draw a "Back" button at the top right of the side panel
         back_button_width = 100
         back_button_height = 40
@@ -1095,6 +1192,13 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
 
     idx = 0
     total = len(mistake_positions)
+    # One engine for the whole review screen, kept searching the shown position
+    engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
+    live = LiveAnalysis(engine, color)
+    move_index = MoveIndex()
+    def close_engine():
+        live.stop()
+        engine.quit()
     # For interactive play, keep a working board for each mistake position
     working_boards = [pos[0].copy() for pos in mistake_positions]
     prev_working_boards = [prev_pos.copy() for prev_pos in prev_mistake_positions]
@@ -1130,6 +1234,7 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
                 if prev_button_rect.collidepoint(mouse_x, mouse_y):
                     idx = (idx - 1) % total
                     working_boards[idx] = mistake_positions[idx][0].copy()
+                    move_index.invalidate()
                     selected_square = None
                     legal_moves = []
                     show_best = False
@@ -1137,6 +1242,7 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
                 elif next_button_rect.collidepoint(mouse_x, mouse_y):
                     idx = (idx + 1) % total
                     working_boards[idx] = mistake_positions[idx][0].copy()
+                    move_index.invalidate()
                     selected_square = None
                     legal_moves = []
                     show_best = False
@@ -1144,6 +1250,7 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
                 elif retry_button_rect.collidepoint(mouse_x, mouse_y):
                     # Reset to position before the mistake (always even index)
                     prev_working_boards[idx] = prev_mistake_positions[idx].copy()
+                    move_index.invalidate()
                     selected_square = None
                     legal_moves = []
                     show_best = False
@@ -1152,12 +1259,13 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
                     # Show the best move instead of the mistake
                     # Find the board before the mistake
                     board_before = prev_mistake_positions[idx].copy()
-                    with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-                        result = engine.play(board_before, chess.engine.Limit(time=0.2))
-                        best_move = result.move
+                    live.stop()
+                    result = engine.play(board_before, chess.engine.Limit(time=0.2))
+                    best_move = result.move
                     if best_move:
                         prev_working_boards[idx] = board_before.copy()
                         prev_working_boards[idx].push(best_move)
+                        move_index.invalidate()
                         selected_square = None
                         legal_moves = []
                         show_best = True
@@ -1167,10 +1275,15 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
                 elif back_button_rect.collidepoint(mouse_x, mouse_y):
                     # Return to main menu
                     running = False
-                    mainmenu(pgn_string, color, stockfish_path,mistakes_set,accuracy)
+                    close_engine()
+                    mainmenu(pgn_string, color, stockfish_path,mistakes_set,accuracy, progress)
+                    return
                     # Optionally, break or return a value to signal main() to show menu again
                 elif return_button_rect.collidepoint(mouse_x, mouse_y):
                     running = False
+                    close_engine()
+                    if progress is not None:
+                        progress.stop()
                     # Call start_window to return to the PGN entry screen
                     start_window(username, stockfish_path)
                     return  # Prevent further drawing after quitting
@@ -1189,7 +1302,7 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
                         if piece and piece.color == board.turn:
                             selected_square = square
                             # Show legal moves for this piece
-                            legal_moves = [m for m in board.legal_moves if m.from_square == square]
+                            legal_moves = move_index.legal_moves_from(board, square)
                         else:
                             selected_square = None
                             legal_moves = []
@@ -1202,9 +1315,14 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
                                 break
                         if move:
                             board.push(move)
+                            move_index.invalidate()
                         # Reset selection after move attempt
                         selected_square = None
                         legal_moves = []
+    close_engine()
+    if progress is not None:
+        progress.stop()
+    stop_background_queue()
     pygame.display.quit()
     pygame.quit()
     
@@ -1215,7 +1333,8 @@ def show_board_at_first_mistake_pygame(pgn_string, color, stockfish_path,choice,
 #intilaize username
 username = "yorubap"
 #start code
-start_window(username,STOCKFISH_PATH)
+if __name__ == "__main__":
+    start_window(username,STOCKFISH_PATH)
 
 
 
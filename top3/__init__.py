@@ -0,0 +1,27 @@
+"""
+Analysis core of Top 3 Chess Mistakes, usable without the pygame dashboard.
+Importing this package never imports pygame or opens a window.
+"""
+from top3.core import (
+    analyse_game,
+    evaluate_fen,
+    find_mistakes,
+    format_eval,
+    get_player_color,
+    player_color,
+    is_endgame,
+    is_pgn_structurally_valid,
+    pgn_parser,
+)
+from top3.phase import DEFAULT_RULES, PhaseRules
+from top3.record import (
+    COLUMNS,
+    ENDGAME,
+    MIDDLEGAME,
+    NO_MATE,
+    OPENING,
+    PHASE_NAMES,
+    GameRecord,
+    decode_move,
+    encode_move,
+)
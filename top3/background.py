@@ -0,0 +1,135 @@
+"""
+Background analysis of pasted or imported games, e.g. a whole archive pasted into the
+dashboard. Pasted text is split into games and each game validated and analysed, one
+at a time, on a worker thread with its own engine; the caller only polls the counters
+and error.
+"""
+import collections
+import io
+import queue
+import threading
+
+import chess.pgn
+
+from top3.core import analyse_plies, game_hash, pgn_parser, player_color
+from top3.engines import open_engine
+from top3.ingest import game_texts
+
+
+class Stopped(Exception):
+    """Raised inside analyse_plies to abandon the game being analysed when stopping."""
+
+
+class AnalysisQueue:
+    """
+    Analyses queued PGN texts for username on a daemon thread. Games that fail pgn_parser
+    or were not played by username are counted as skipped. The mistakes of each analysed
+    game are added to mistake_index (a top3.mistakeindex.MistakeIndex, which may be shared
+    with other threads) if given. If the engine cannot be started, error holds the reason
+    and every game queued is counted as skipped. options are passed on to analyse_plies.
+    queued counts the games found so far: texts are split on the worker thread, so a
+    large paste is counted shortly after put_text returns.
+    """
+    def __init__(self, stockfish_path, username, mistake_index=None, engine_options=None, **options):
+        self.stockfish_path = stockfish_path
+        self.username = username
+        self.mistake_index = mistake_index
+        self.engine_options = engine_options
+        self.options = options
+        self.texts = queue.Queue()
+        self.stopped = threading.Event()
+        self.queued = 0
+        self.done = 0
+        self.skipped = 0
+        self.error = None
+        self.thread = None
+
+    def put_text(self, text):
+        """Queues text, a PGN string with one or more games. Returns straight away."""
+        self.texts.put(text)
+        if self.error is not None:
+            self._drain()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    @property
+    def pending(self):
+        """Games found but not yet analysed or skipped, plus texts not yet split into games."""
+        return self.queued - self.done - self.skipped + self.texts.qsize()
+
+    def _split(self, text):
+        games = list(game_texts(io.StringIO(text)))
+        self.queued += len(games)
+        return games
+
+    def _run(self):
+        try:
+            engine = open_engine(self.stockfish_path, self.engine_options)
+        except Exception as e:
+            self.error = f"Could not start the engine: {e}"
+            self._drain()
+            return
+        backlog = collections.deque()
+        try:
+            while True:
+                # Split newly queued texts, waiting for one only when nothing is left to analyse
+                while True:
+                    try:
+                        text = self.texts.get(block=not backlog)
+                    except queue.Empty:
+                        break
+                    if text is None:
+                        self.skipped += len(backlog)
+                        return
+                    backlog.extend(self._split(text))
+                self._analyse(engine, backlog.popleft())
+        finally:
+            engine.quit()
+
+    def _check_stopped(self, ply):
+        if self.stopped.is_set():
+            raise Stopped()
+
+    def _analyse(self, engine, text):
+        if self.stopped.is_set():
+            self.skipped += 1
+            return
+        try:
+            if not pgn_parser(text)[0]:
+                self.skipped += 1
+                return
+            game = chess.pgn.read_game(io.StringIO(text))
+            color = player_color(game.headers, self.username)
+            if color is None:
+                self.skipped += 1
+                return
+            record = analyse_plies(game, color, engine, on_ply=self._check_stopped, **self.options)
+            if self.mistake_index is not None:
+                self.mistake_index.add_record(record, game_hash(game))
+            self.done += 1
+        except Exception:
+            self.skipped += 1
+
+    def _drain(self):
+        # Drops the texts still queued, counting their games as skipped
+        while True:
+            try:
+                text = self.texts.get_nowait()
+            except queue.Empty:
+                break
+            if text is not None:
+                self.skipped += len(self._split(text))
+
+    def stop(self):
+        """
+        Stops after the ply being analysed, abandoning the rest of the queue, and quits
+        the engine.
+        """
+        if self.thread is None:
+            return
+        self.stopped.set()
+        self._drain()
+        self.texts.put(None)
+        self.thread.join()
+        self.thread = None
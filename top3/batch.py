@@ -0,0 +1,200 @@
+"""
+Resumable batch analysis of a PGN archive.
+
+    python -m top3.batch archive.pgn.zst --username yorubap --stockfish /usr/bin/stockfish \
+        --journal archive.journal --out records/ --store archive
+
+Every analysed ply and every finished game is appended to a journal file and flushed
+to disk straight away. Running the same command again after a crash skips finished
+games and continues an interrupted game from its last journaled ply.
+The archive may be compressed (.gz, .bz2, .xz, .zst) and is streamed game by game;
+games the user did not play are skipped on their headers.
+With --store, finished games are also appended to a memory-mapped store (top3.store).
+"""
+import argparse
+import json
+import os
+
+from top3.core import analyse_plies, game_hash, player_color
+from top3.dedup import PositionCache
+from top3.engines import open_engine
+from top3.ingest import read_games
+from top3.memory import MemoryProfiler
+from top3.mistakeindex import MistakeIndex
+from top3.pgnindex import player_games
+from top3.record import decode_move, encode_move
+from top3.store import StoreWriter
+
+
+class Journal:
+    """
+    Append-only JSON lines file of analysed plies and finished games:
+        {"game": key, "ply": [ply, side, score, mate, best, played, phase]}
+        {"game": key, "done": true, "color": color}
+    A line cut short by a crash is ignored when the journal is read back, and cut off
+    before anything new is appended.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.finished = {}
+        self.partial = {}
+        if os.path.exists(path):
+            self._load()
+            self._truncate_partial_line()
+        self.file = open(path, "a")
+
+    def _truncate_partial_line(self):
+        # Otherwise the next entry would be appended to the torn line and lost with it
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(0, end - 4096)
+                f.seek(start)
+                block = f.read(end - start)
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+            f.truncate(end)
+
+    def _load(self):
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                key = entry["game"]
+                if entry.get("done"):
+                    self.finished[key] = entry["color"]
+                    self.partial.pop(key, None)
+                else:
+                    ply, side, score, mate, best, played, phase = entry["ply"]
+                    plies = self.partial.setdefault(key, [])
+                    # A ply may have been journaled twice if a crash hit between write and exit
+                    if ply == len(plies):
+                        plies.append((ply, bool(side), score, mate, decode_move(best), decode_move(played), phase))
+
+    def _write(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def add_ply(self, key, ply):
+        ply_number, side, score, mate, best, played, phase = ply
+        self._write({"game": key, "ply": [
+            ply_number, int(side), int(score), int(mate), encode_move(best), encode_move(played), int(phase)
+        ]})
+        self.partial.setdefault(key, []).append(ply)
+
+    def finish(self, key, color):
+        self._write({"game": key, "done": True, "color": color})
+        self.finished[key] = color
+        # The finished game's plies are not needed any more
+        self.partial.pop(key, None)
+
+    def close(self):
+        self.file.close()
+
+
+def run_batch(games, username, engine, journal, out_dir=None, cache=None, store=None, mistakes=None,
+              profiler=None, **options):
+    """
+    Analyses every game of username in games, journaling as it goes.
+    Games already finished in the journal are skipped; an unfinished one resumes
+    from its journaled plies. Records are written to out_dir as <game hash>.npz if given
+    and appended to store, a StoreWriter, if given (a game stored before a crash cut
+    its journal entry short is not stored twice). Their mistakes are added to
+    mistakes, a top3.mistakeindex.MistakeIndex, if given.
+    profiler (a top3.memory.MemoryProfiler) measures the read, analyse and save stages.
+    Bound cache (max_entries, max_mb) to keep a long run within a fixed footprint.
+    options are passed on to analyse_plies.
+    Returns the number of games analysed in this run.
+    """
+    if cache is None:
+        cache = PositionCache()
+    if profiler is None:
+        profiler = MemoryProfiler(enabled=False)
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+    analysed = 0
+    games = iter(games)
+    while True:
+        with profiler.stage("read"):
+            game = next(games, None)
+        if game is None:
+            break
+        color = player_color(game.headers, username)
+        if color is None:
+            continue
+        key = game_hash(game)
+        if key in journal.finished:
+            continue
+        with profiler.stage("analyse"):
+            record = analyse_plies(
+                game, color, engine, cache,
+                done=journal.partial.get(key, ()),
+                on_ply=lambda ply, key=key: journal.add_ply(key, ply),
+                **options,
+            )
+        with profiler.stage("save"):
+            if out_dir is not None:
+                record.save(os.path.join(out_dir, f"{key}.npz"))
+            if store is not None:
+                store.add(record, key)
+            if mistakes is not None:
+                mistakes.add_record(record, key)
+        journal.finish(key, color)
+        analysed += 1
+    return analysed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumable batch analysis of a PGN archive")
+    parser.add_argument("pgn", help="PGN file with one or more games, optionally .gz/.bz2/.xz/.zst compressed")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--stockfish", required=True, help="Path to the Stockfish executable")
+    parser.add_argument("--journal", required=True, help="Journal file, reused to resume a run")
+    parser.add_argument("--out", help="Folder for one .npz record per game")
+    parser.add_argument("--store", help="Path prefix of a store (.plies/.games files) to append results to")
+    parser.add_argument("--mistakes", help="Mistake index file to add every game's mistakes to")
+    parser.add_argument("--hash", type=int, default=256, help="Engine hash table size in MB")
+    parser.add_argument("--continuation", action="store_true",
+                        help="Send positions as start position + moves and keep the hash for the whole game")
+    parser.add_argument("--validate", action="store_true", help="Skip games that fail the pasted-PGN checks")
+    parser.add_argument("--index", action="store_true",
+                        help="Find the user's games through a header index kept next to the PGN (<pgn>.idx.npz)")
+    parser.add_argument("--cache-entries", type=int, help="Most engine results kept for reuse across games")
+    parser.add_argument("--memory-limit", type=float,
+                        help="MB of cached engine results to keep; the least recently used are dropped beyond it")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="Report memory allocated per stage (tracemalloc) and the peak RSS at the end")
+    parser.add_argument("--deadline", type=float, help="Seconds to spend on each game, shared out over its plies")
+    args = parser.parse_args()
+    if args.index:
+        games = player_games(args.pgn, args.username)
+    else:
+        games = read_games(args.pgn, args.username, args.validate)
+    profiler = MemoryProfiler(enabled=args.profile_memory)
+    journal = Journal(args.journal)
+    store = StoreWriter(args.store) if args.store else None
+    try:
+        with open_engine(args.stockfish, {"Hash": args.hash}) as engine:
+            analysed = run_batch(
+                games, args.username, engine, journal, args.out,
+                store=store, mistakes=MistakeIndex(args.mistakes) if args.mistakes else None,
+                cache=PositionCache(args.cache_entries, args.memory_limit), profiler=profiler,
+                continuation=args.continuation, deadline=args.deadline,
+            )
+    finally:
+        journal.close()
+        if store is not None:
+            store.close()
+    print(f"Analysed {analysed} games, {len(journal.finished)} finished in total")
+    if args.profile_memory:
+        print(profiler.report())
+
+
+if __name__ == "__main__":
+    main()
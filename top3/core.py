@@ -0,0 +1,397 @@
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+import hashlib
+import io
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from top3.deadline import FALLBACK_NODES, Deadline, volatility
+from top3.engines import EnginePool
+from top3.phase import classify as classify_phase, is_endgame_position
+from top3.record import GameRecord, score_columns
+
+def format_eval(score, turn):
+    """
+    Converts an engine PovScore into the display value used everywhere:
+    pawns as a float, or "# n" for a forced mate, from turn's perspective.
+    """
+    # Use .white() or .black() based on whose turn it is
+    if turn == chess.WHITE:
+        s = score.white()
+    else:
+        s = score.black()
+    if s.is_mate():
+        return f"# {s.mate()}"
+    return s.score() / 100
+
+def evaluate_fen(fen, engine, turn):
+    board = chess.Board(fen)
+    info = engine.analyse(board, chess.engine.Limit(time=0.1))
+    return format_eval(info["score"], turn)
+def is_endgame(board):
+    """
+    Returns "yes" if both sides have 2 or fewer minor/major pieces (not counting pawns/kings), else "no".
+    """
+    return "yes" if is_endgame_position(board) else "no"
+
+
+def get_player_color(pgn_string, username):
+    """
+    Returns 'white' or 'black' depending on which color the username played in the PGN.
+    If username not found, returns None.
+    """
+    # Only the headers are needed, the movetext is skipped without being parsed
+    headers = chess.pgn.read_headers(io.StringIO(pgn_string))
+    return player_color(headers, username)
+
+def player_color(headers, username):
+    """Same as get_player_color, for already parsed PGN headers."""
+    white = headers.get("White", "").strip().lower()
+    black = headers.get("Black", "").strip().lower()
+    username_lower = username.strip().lower()
+    if username_lower == white:
+        return "white"
+    elif username_lower == black:
+        return "black"
+    else:
+        return None
+
+def pgn_parser(pgn_string):
+    # First, check PGN structure before move legality
+    structure_valid, structure_message = is_pgn_structurally_valid(pgn_string)
+    if not structure_valid:
+        return False, structure_message
+    # Remove header lines and join move text
+    lines = pgn_string.strip().split('\n')
+    move_lines = [line for line in lines if not line.startswith('[')]
+    move_text = ' '.join(move_lines)
+    # Remove result (e.g. 1-0, 0-1, 1/2-1/2)
+    move_text = re.sub(r"\d-\d|\d/\d-\d/\d", "", move_text)
+    # Remove comments and NAGs
+    move_text = re.sub(r"\{[^}]*\}", "", move_text)
+    move_text = re.sub(r"\$\d+", "", move_text)
+    # Split into tokens
+    tokens = move_text.split()
+    # Remove move numbers
+    moves = [tok for tok in tokens if not re.match(r"^\d+\.*$", tok)]
+    board = chess.Board()
+    old_stderr = sys.stderr
+    sys.stderr = io.StringIO()
+    try:
+        for idx, san in enumerate(moves):
+            found_move = None
+            for move in board.legal_moves:
+                try:
+                    if board.san(move) == san:
+                        found_move = move
+                        break
+                except Exception:
+                    continue
+            if found_move:
+                board.push(found_move)
+            else:
+                move_number = board.fullmove_number
+                side = "White" if board.turn == chess.WHITE else "Black"
+                move_prefix = f"{move_number}." if board.turn == chess.WHITE else f"{move_number}..."
+                return False, f"Illegal move {move_prefix} {san} ({side})"
+        return True, None
+    finally:
+        sys.stderr = old_stderr  # Always restore stderr after all parsing
+def is_pgn_structurally_valid(pgn_string):
+    """
+    Checks if the PGN string has a valid structure:
+    - Contains at least required headers ([Event], [Site], [Date], [White], [Black])
+    - Headers are in correct format ([Key "Value"])
+    - Contains at least one move in valid SAN notation
+    - Does not look like plain text or random input
+    Returns (True, None) if valid, (False, error_message) if not.
+    """
+
+    # 1. Check for required headers and malformed headers
+    required_headers = ["Event", "Site", "Date", "White", "Black"]
+    headers_found = {h: False for h in required_headers}
+    header_pattern = re.compile(r'^\[(\w+)\s+"(.*)"\]$')
+    lines = pgn_string.strip().splitlines()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        # Simple error message for header issues
+        #if not line.startswith('[')  and any(h in line for h in required_headers):
+            #return False, f"PGN Header Error: Missing opening bracket in header: {line}"
+        # Check for unclosed bracket or quote in header lines
+        if line.startswith('['):
+            if not line.endswith(']'):
+                return False, "PGN Structure Error"
+            if line.count('"') % 2 != 0:
+                return False, "PGN Structure Error"
+            m = header_pattern.match(line)
+            if m:
+                key = m.group(1)
+                if key in headers_found:
+                    headers_found[key] = True
+        elif line and not line.startswith('['):
+            break  # Stop checking headers once moves start
+
+    missing = [h for h, found in headers_found.items() if not found]
+    if missing:
+        return False, "PGN Structure Error"
+
+    # 2. Check for at least one move in SAN notation
+    move_lines = [line for line in lines if not line.startswith('[') and line.strip()]
+    move_text = ' '.join(move_lines)
+    # Remove result
+    move_text = re.sub(r"\d-\d|\d/\d-\d/\d", "", move_text)
+    # Remove comments and NAGs
+    move_text = re.sub(r"\{[^}]*\}", "", move_text)
+    move_text = re.sub(r"\$\d+", "", move_text)
+    # Split into tokens
+    tokens = move_text.split()
+    # Remove move numbers
+    moves = [tok for tok in tokens if not re.match(r"^\d+\.*$", tok)]
+    # Remove result tokens
+    moves = [tok for tok in moves if tok not in ["1-0", "0-1", "1/2-1/2", "*"]]
+
+    # Basic SAN move pattern: e4, Nf3, Qxe5, O-O, O-O-O, etc.
+    san_pattern = re.compile(r"^(O-O(-O)?|[KQRBN]?[a-h]?[1-8]?x?[a-h][1-8](=[QRBN])?|[a-h][1-8])[\+#=]?$")
+    valid_moves = [m for m in moves if san_pattern.match(m)]
+    if not valid_moves:
+        return False, "PGN Structure Error"
+
+    # 3. Check for plain text (e.g., "hello world" or random text)
+    if len(valid_moves) < max(1, len(moves) // 2):
+        return False, "PGN Structure Error"
+
+    return True, None
+def game_hash(game):
+    """
+    Identifies a game by its starting position and mainline moves only, so the same game
+    imported twice (different headers, comments or move number formatting) gets the same hash.
+    """
+    moves = " ".join(move.uci() for move in game.mainline_moves())
+    return hashlib.sha1(f"{game.board().fen()}|{moves}".encode()).hexdigest()
+
+# The searches below take game=None by default. In continuation mode analyse_plies passes
+# the game being analysed: positions then always go to the engine as start position + moves,
+# and python-chess only sends ucinewgame (clearing the hash) when the game changes.
+
+def best_move_search(engine, board, game=None, seconds=0.5):
+    """The engine's best move for board (0.5 s search by default), or None."""
+    info = engine.analyse(board, chess.engine.Limit(time=seconds), game=game)
+    return info.get("pv", [None])[0]
+
+def eval_search(engine, board, game=None, seconds=0.1):
+    """(score, mate) record columns for board from a 0.1 s search by default."""
+    if game is None:
+        board = chess.Board(board.fen())
+    info = engine.analyse(board, chess.engine.Limit(time=seconds), game=game)
+    return score_columns(info["score"])
+
+def baseline_search(engine, board, nodes, game=None):
+    """(score, mate) record columns for board from a cheap fixed-node search."""
+    info = engine.analyse(board, chess.engine.Limit(nodes=nodes), game=game)
+    return score_columns(info["score"])
+
+def multipv_search(engine, board, move, lines=3, game=None, seconds=0.5):
+    """
+    Searches the position before move once with MultiPV and returns (best_move, score, mate),
+    score and mate being the record columns for the played move's line. Best and played
+    move are then scored by the same search at the same depth. Only when the played move
+    is not among the lines is a second search made, restricted to it (UCI searchmoves)
+    from the same position, so it still reuses the engine's hash table. The second search
+    goes to the depth the first one reached (or gets the same time if the engine reports
+    no depth), so both moves are scored at the same depth.
+    """
+    infos = engine.analyse(board, chess.engine.Limit(time=seconds), multipv=lines, game=game)
+    best_move = infos[0].get("pv", [None])[0]
+    for info in infos:
+        if info.get("pv") and info["pv"][0] == move:
+            return (best_move,) + score_columns(info["score"])
+    depth = infos[0].get("depth")
+    limit = chess.engine.Limit(depth=depth) if depth else chess.engine.Limit(time=seconds)
+    info = engine.analyse(board, limit, root_moves=[move], game=game)
+    return (best_move,) + score_columns(info["score"])
+
+def _cached(cache, kind, board, search, extra=()):
+    """Runs search, or with a cache reuses the result for the same search of the same position."""
+    if cache is None:
+        return search()
+    return cache.get((kind, chess.polyglot.zobrist_hash(board)) + tuple(extra), search)
+
+def _analyse_ply(engine, board, ply, move, player_side, cache, multipv, opponent_nodes, engine_game, budget=None):
+    """
+    Searches one ply for analyse_plies, pushes move on board and returns the ply tuple.
+    budget is the seconds the ply may take (from a Deadline), split 5:1 between the search
+    before the move and the one after like the default 0.5 s and 0.1 s. A budget of 0
+    means the deadline's time is used up: the position after the move just gets one
+    search of FALLBACK_NODES nodes, for the next ply's eval change, and the played move
+    is stored as the best move, so a ply nobody searched properly is never reported as
+    a mistake.
+    """
+    best_seconds, eval_seconds = (0.5, 0.1) if budget is None else (budget * 5 / 6, budget / 6)
+    side = board.turn
+    #Game stage of the position the move was played from
+    phase = classify_phase(board)
+    if (opponent_nodes and side != player_side) or budget == 0:
+        nodes = FALLBACK_NODES if budget == 0 else opponent_nodes
+        best_move = move if budget == 0 else None
+        board.push(move)
+        score, mate = _cached(
+            cache, "nodes", board, lambda: baseline_search(engine, board, nodes, engine_game), [nodes]
+        )
+    elif multipv:
+        best_move, score, mate = _cached(
+            cache, "multipv", board, lambda: multipv_search(engine, board, move, multipv, engine_game, best_seconds + eval_seconds),
+            [move.uci()]
+        )
+        board.push(move)
+    else:
+        #Get the best move from the engine for this position
+        best_move = _cached(cache, "best", board, lambda: best_move_search(engine, board, engine_game, best_seconds))
+        board.push(move)
+        score, mate = _cached(cache, "eval", board, lambda: eval_search(engine, board, engine_game, eval_seconds))
+    return (ply, side, score, mate, best_move, move, phase)
+
+def _search_plies(engine, board, moves, start, end, player_side, cache, multipv, opponent_nodes, engine_game,
+                  deadline=None, history=()):
+    """
+    Yields the ply tuples of moves[start:end], board being the position before moves[start].
+    With deadline (seconds) the stretch gets that much time in total, shared out by a
+    top3.deadline.Deadline weighted by each ply's volatility; history holds the ply
+    tuples analysed before start, for the eval swing.
+    """
+    schedule = None
+    if deadline is not None:
+        # Plies searched by node count take no share of the time
+        timed = sum(
+            1 for ply in range(start, end)
+            if not opponent_nodes or (board.turn if (ply - start) % 2 == 0 else not board.turn) == player_side
+        )
+        schedule = Deadline(deadline, timed)
+    recent = list(history[-2:])
+    for ply in range(start, end):
+        move = moves[ply]
+        budget = None
+        if schedule is not None and (not opponent_nodes or board.turn == player_side):
+            budget = schedule.budget(volatility(board, move, recent))
+        recent = recent[-1:] + [_analyse_ply(
+            engine, board, ply, move, player_side, cache, multipv, opponent_nodes, engine_game, budget
+        )]
+        yield recent[-1]
+
+def analyse_plies(game, color, engine, cache=None, done=(), on_ply=None, multipv=None, opponent_nodes=None,
+                  continuation=False, deadline=None):
+    """
+    Runs engine over every ply of a parsed game and returns a GameRecord holding,
+    for each ply, the engine's best move, the evaluation after the move and the game phase.
+    cache (e.g. top3.dedup.PositionCache) lets positions already searched in other
+    games of the same run be reused instead of sent to the engine again.
+    done holds the ply tuples of an interrupted earlier run, which are not searched again,
+    and on_ply is called with each newly analysed ply tuple (see top3.batch).
+    With multipv (number of lines, e.g. 3) each ply costs one MultiPV search of the
+    position before the move instead of a best-move search plus an evaluation (see multipv_search).
+    With opponent_nodes only color's moves get the full searches: after an opponent move
+    the position is just evaluated with a search of that many nodes, as the baseline for
+    color's next move, and no best move is stored (the record is then only meant for color).
+    With continuation every position is sent as start position + moves and the engine keeps
+    its hash table for the whole game, only clearing it when the next game starts, so
+    consecutive plies reuse each other's search trees (give the engine a large Hash).
+    With deadline (seconds) the remaining plies share that much time instead of taking
+    0.6 s each, volatile plies getting more than quiet ones (see top3.deadline).
+    """
+    player_side = chess.WHITE if color.lower() == "white" else chess.BLACK
+    engine_game = game if continuation else None
+    moves = list(game.mainline_moves())
+    board = game.board()
+    plies = list(done)
+    for move in moves[:len(plies)]:
+        board.push(move)
+    for ply in _search_plies(
+        engine, board, moves, len(plies), len(moves), player_side, cache, multipv, opponent_nodes, engine_game,
+        deadline, plies,
+    ):
+        plies.append(ply)
+        if on_ply is not None:
+            on_ply(ply)
+    return GameRecord.from_plies(plies, color, game.board().fen())
+
+def analyse_plies_parallel(game, color, pool, cache=None, done=(), on_ply=None, multipv=None,
+                           opponent_nodes=None, continuation=False, deadline=None):
+    """
+    Same result as analyse_plies, but the game's plies are split into pool.size
+    contiguous stretches searched at the same time, each on its own engine borrowed
+    from pool (a top3.engines.EnginePool), and stitched back together in order.
+    Every position is known up front from the mainline, so the stretches do not
+    depend on each other. on_ply is called in ply order once all stretches are done.
+    With deadline each stretch has the whole deadline to itself.
+    cache is shared by all stretches, so it must be safe to use from several threads,
+    as top3.dedup.PositionCache is.
+    """
+    player_side = chess.WHITE if color.lower() == "white" else chess.BLACK
+    engine_game = game if continuation else None
+    moves = list(game.mainline_moves())
+    start = len(done)
+    size = -(-(len(moves) - start) // pool.size) if len(moves) > start else 1
+    # Board before the first move of each stretch
+    boards = []
+    board = game.board()
+    for ply, move in enumerate(moves):
+        if ply >= start and (ply - start) % size == 0:
+            boards.append((ply, board.copy(stack=False)))
+        board.push(move)
+
+    def run(ply, board):
+        with pool.engine() as engine:
+            return list(_search_plies(
+                engine, board, moves, ply, min(ply + size, len(moves)), player_side, cache, multipv,
+                opponent_nodes, engine_game, deadline, done if ply == start else (),
+            ))
+
+    plies = list(done)
+    with ThreadPoolExecutor(max_workers=pool.size) as executor:
+        stretches = [executor.submit(run, ply, board) for ply, board in boards]
+        for stretch in stretches:
+            for ply in stretch.result():
+                plies.append(ply)
+                if on_ply is not None:
+                    on_ply(ply)
+    return GameRecord.from_plies(plies, color, game.board().fen())
+
+def analyse_game(pgn_string, color, stockfish_path=None, engine=None, engine_options=None, engines=1,
+                 **options):
+    """
+    Analyses the first game in pgn_string for color and returns its GameRecord.
+    Uses engine if one is given (e.g. from an EnginePool), otherwise starts
+    Stockfish from stockfish_path for this game only, configured with engine_options
+    (e.g. {"Hash": 512}). With engines > 1 that many engines are started and the
+    game's plies are split between them (see analyse_plies_parallel).
+    options are passed on to analyse_plies (e.g. multipv=3, opponent_nodes=20000, continuation=True,
+    deadline=10).
+    """
+    game = chess.pgn.read_game(io.StringIO(pgn_string))
+    if engine is not None:
+        return analyse_plies(game, color, engine, **options)
+    if engines > 1:
+        with EnginePool(stockfish_path, engines, engine_options) as pool:
+            return analyse_plies_parallel(game, color, pool, **options)
+    with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
+        if engine_options:
+            engine.configure(engine_options)
+        return analyse_plies(game, color, engine, **options)
+
+def find_mistakes(pgn_string, color,stockfish_path, engines=1, deadline=None):
+    """
+    Returns a dictionary of mistakes for the given color.
+    The dictionary has keys: 'all', 'opening', 'middlegame', 'endgame'.
+    Each value is a list of tuples: (move_number, move, evaluation, change_in_eval)
+    A mistake is any move that reduces evaluation by 0.2 or more,
+    but NOT if the move is the engine's best move.
+    The lists are sorted by the largest negative change in evaluation (worst mistakes first).
+    With engines > 1 the game is split across that many Stockfish processes, and with
+    deadline (seconds) the analysis is fitted into that much time.
+    """
+    record = analyse_game(pgn_string, color, stockfish_path, engines=engines, deadline=deadline)
+    return record.mistakes(), record.accuracy()
@@ -0,0 +1,84 @@
+"""
+Per-game time budget for analyse_plies: "analyse this game in 10 s".
+
+The time left is shared out ply by ply, so plies that finish early leave more for the
+rest. What each ply costs beyond its search time (engine round trips, untimed searches)
+is measured and kept back for the plies still to come, and once the time is used up the
+remaining plies get a single search of FALLBACK_NODES nodes each. A game therefore ends
+close to the deadline, overrunning it by at most those cheap searches. Volatile plies
+(captures, checks, big eval swings) get a larger share than quiet ones.
+"""
+import time
+
+from top3.record import NO_MATE
+
+# Expected weight of a ply not yet seen, until some plies have been weighed
+DEFAULT_WEIGHT = 1.5
+# Nodes of the one search a ply gets once the time is used up
+FALLBACK_NODES = 1000
+
+
+def volatility(board, move, plies):
+    """
+    Weight of the ply move from board: 1 for a quiet move, more for captures, checks
+    and after a large eval swing between the last two analysed plies (ply tuples).
+    """
+    weight = 1.0
+    if board.is_capture(move):
+        weight += 1.0
+    if board.is_check() or board.gives_check(move):
+        weight += 1.0
+    if len(plies) >= 2:
+        _, _, score, mate, _, _, _ = plies[-1]
+        _, _, previous_score, previous_mate, _, _, _ = plies[-2]
+        if mate != NO_MATE or previous_mate != NO_MATE:
+            weight += 2.0
+        else:
+            weight += min(abs(int(score) - int(previous_score)) / 100.0, 2.0)
+    return weight
+
+
+class Deadline:
+    """
+    Splits seconds over plies searches. budget(weight) returns the seconds for the next
+    ply: its share of the time left, weighted against the average weight of the plies
+    seen so far. The time between two budget calls beyond the seconds handed out is the
+    ply's overhead; the average overhead so far is kept back for every ply still to come.
+    reserve is the fraction of seconds kept back from the start. A ply whose share would
+    be under minimum seconds gets 0: the time is used up and it should be given one
+    cheap search (FALLBACK_NODES) instead.
+    """
+    def __init__(self, seconds, plies, reserve=0.1, minimum=0.01):
+        self.end = time.monotonic() + seconds * (1 - reserve)
+        self.remaining = plies
+        self.minimum = minimum
+        self.total_weight = 0.0
+        self.weighed = 0
+        self.overhead = 0.0
+        self.measured = 0
+        self.last = None
+
+    def time_left(self):
+        return max(0.0, self.end - time.monotonic())
+
+    def _measure(self, now):
+        if self.last is not None:
+            started, seconds = self.last
+            self.overhead += max(0.0, now - started - seconds)
+            self.measured += 1
+
+    def budget(self, weight):
+        now = time.monotonic()
+        self._measure(now)
+        self.total_weight += weight
+        self.weighed += 1
+        mean = self.total_weight / self.weighed if self.weighed > 1 else DEFAULT_WEIGHT
+        share = weight / (weight + max(self.remaining - 1, 0) * mean)
+        overhead = self.overhead / self.measured if self.measured else 0.0
+        self.remaining = max(self.remaining - 1, 0)
+        # This ply's and every later ply's overhead comes out of the time left first
+        seconds = (self.time_left() - (self.remaining + 1) * overhead) * share
+        if seconds < self.minimum:
+            seconds = 0.0
+        self.last = (now, seconds)
+        return seconds
@@ -0,0 +1,107 @@
+"""
+Deduplication ahead of archive analysis: a game imported twice is analysed once,
+and a position reached in several games is sent to the engine once per run.
+"""
+import threading
+from collections import OrderedDict
+
+from top3.core import analyse_plies, game_hash
+from top3.memory import approximate_size
+
+
+class PositionCache:
+    """
+    Engine results shared by all games of a run, keyed by (search kind, Zobrist hash).
+    analyse_plies asks it for every search; only positions not seen before in the
+    run reach the engine. With max_entries, and with max_mb (megabytes of results, by
+    top3.memory.approximate_size), the least recently used results are dropped once it
+    is full, so a long run keeps a fixed footprint.
+    Safe to share between threads (analyse_plies_parallel): the bookkeeping is locked,
+    the search itself is not, so two threads may both search a position neither has
+    finished yet.
+    """
+    def __init__(self, max_entries=None, max_mb=None):
+        self.results = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024 if max_mb else None
+        self.lookups = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, search):
+        with self.lock:
+            self.lookups += 1
+            if key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+            self.misses += 1
+        result = search()
+        size = approximate_size(key) + approximate_size(result)
+        with self.lock:
+            if key not in self.results:
+                self.results[key] = result
+                self.sizes[key] = size
+                self.bytes += size
+            while self.results and (
+                (self.max_entries is not None and len(self.results) > self.max_entries)
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                old, _ = self.results.popitem(last=False)
+                self.bytes -= self.sizes.pop(old)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.sizes.clear()
+            self.bytes = 0
+
+    @property
+    def searches(self):
+        return self.misses
+
+
+def dedup_games(games):
+    """
+    Returns (unique, index): the distinct games by game_hash in first-seen order,
+    and for every input game the position of its copy in unique.
+    """
+    unique = []
+    positions = {}
+    index = []
+    for game in games:
+        key = game_hash(game)
+        if key not in positions:
+            positions[key] = len(unique)
+            unique.append(game)
+        index.append(positions[key])
+    return unique, index
+
+
+def analyse_archive(jobs, engine, cache=None):
+    """
+    Analyses jobs, a list of (chess.pgn.Game, color), and returns their GameRecords in
+    the same order. Each distinct game is analysed once, whichever colour is asked for,
+    and positions shared between games are searched once through cache.
+    Returns (records, stats) where stats counts games, unique games, position lookups
+    and engine searches.
+    """
+    if cache is None:
+        cache = PositionCache()
+    unique, index = dedup_games([game for game, _ in jobs])
+    records = {}
+    results = []
+    for (game, color), i in zip(jobs, index):
+        if i not in records:
+            records[i] = analyse_plies(unique[i], color, engine, cache)
+        record = records[i]
+        results.append(record if record.color == color.lower() else record.for_color(color))
+    stats = {
+        "games": len(jobs),
+        "unique_games": len(unique),
+        "lookups": cache.lookups,
+        "searches": cache.searches,
+    }
+    return results, stats
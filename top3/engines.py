@@ -0,0 +1,57 @@
+import queue
+from contextlib import contextmanager
+
+import chess.engine
+
+
+def open_engine(stockfish_path, options=None):
+    """Starts Stockfish and applies UCI options such as {"Hash": 256, "Threads": 2}."""
+    engine = chess.engine.SimpleEngine.popen_uci(stockfish_path)
+    if options:
+        engine.configure(options)
+    return engine
+
+
+class EnginePool:
+    """
+    A fixed number of warm engines shared by worker threads, so analysing a game
+    borrows an already running engine instead of launching a new one.
+    An engine that crashes while borrowed is replaced by a fresh one.
+    """
+    def __init__(self, stockfish_path, size=2, options=None):
+        self.stockfish_path = stockfish_path
+        self.options = options
+        self.size = size
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(open_engine(stockfish_path, options))
+
+    @contextmanager
+    def engine(self):
+        """Borrows an engine for the duration of the with block, waiting if all are busy."""
+        engine = self.idle.get()
+        try:
+            yield engine
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError):
+            try:
+                engine.close()
+            except Exception:
+                pass
+            engine = open_engine(self.stockfish_path, self.options)
+            raise
+        finally:
+            self.idle.put(engine)
+
+    def close(self):
+        for _ in range(self.size):
+            engine = self.idle.get()
+            try:
+                engine.quit()
+            except Exception:
+                engine.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
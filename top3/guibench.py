@@ -0,0 +1,363 @@
+"""
+Headless frame-time benchmark of the dashboard screens.
+
+    python -m top3.guibench --frames 300 --allocations --save-baseline guibench.json
+    python -m top3.guibench --frames 300 --allocations --baseline guibench.json
+
+Runs start_window, mainmenu and the review screen of code.py under SDL's dummy video
+driver, with a stub engine and clipboard and a script of input events (paste, scrolling,
+next/previous mistake, Best, board clicks), and reports the time per frame and, with
+--allocations, the memory allocated per frame. Numbers are only comparable between
+runs on the same machine, so save a baseline before changing the drawing code and
+compare against it afterwards: the run exits with status 1 if a screen's p95 frame time
+or mean allocation per frame grew by more than --tolerance, or went over --max-ms or
+--max-kb.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import chess
+import chess.engine
+import chess.polyglot
+import numpy as np
+
+GUI_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code.py")
+
+SAMPLE_PGN = """[Event "Paris"]
+[Site "Paris FRA"]
+[Date "1858.??.??"]
+[White "yorubap"]
+[Black "Duke Karl"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 d6 3. d4 Bg4 4. dxe5 Bxf3 5. Qxf3 dxe5 6. Bc4 Nf6 7. Qb3 Qe7 8. Nc3 c6
+9. Bg5 b5 10. Nxb5 cxb5 11. Bxb5+ Nbd7 12. O-O-O Rd8 13. Rxd7 Rxd7 14. Rd1 Qe6
+15. Bxd7+ Nxd7 16. Qb8+ Nxb8 17. Rd8# 1-0
+"""
+
+# Growth below these is noise on fast screens, whatever the tolerance
+NOISE = {"p95_ms": 0.5, "mean_kb": 1.0}
+
+PIECE_VALUES = {chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 300, chess.ROOK: 500, chess.QUEEN: 900}
+
+
+def stub_score(board):
+    """
+    Material balance in centipawns from White's point of view, plus up to a pawn either
+    way taken from the position's Zobrist hash, so the sample game has mistakes to review.
+    """
+    material = sum(
+        value * (chess.popcount(board.pieces_mask(piece_type, chess.WHITE))
+                 - chess.popcount(board.pieces_mask(piece_type, chess.BLACK)))
+        for piece_type, value in PIECE_VALUES.items()
+    )
+    return material + chess.polyglot.zobrist_hash(board) % 201 - 100
+
+
+class StubAnalysis:
+    """Stands in for chess.engine.SimpleAnalysisResult with results that are already final."""
+    def __init__(self, infos):
+        self.multipv = infos
+        self.info = infos[0]
+
+    def stop(self):
+        pass
+
+
+class StubEngine:
+    """
+    Stands in for chess.engine.SimpleEngine: answers instantly with stub_score as the
+    score and the first legal moves as lines, so only the GUI's own time is measured.
+    """
+    def analyse(self, board, limit=None, multipv=None, game=None, root_moves=None, **kwargs):
+        moves = list(root_moves or board.legal_moves)
+        if not moves:
+            score = chess.engine.Mate(0) if board.is_checkmate() else chess.engine.Cp(0)
+            infos = [{"score": chess.engine.PovScore(score, board.turn), "depth": 0}]
+        else:
+            score = chess.engine.PovScore(chess.engine.Cp(stub_score(board)), chess.WHITE)
+            infos = [
+                {"score": score, "pv": [move], "depth": 20, "multipv": i + 1}
+                for i, move in enumerate(moves[:multipv or 1])
+            ]
+        return infos if multipv else infos[0]
+
+    def analysis(self, board, limit=None, multipv=None, **kwargs):
+        return StubAnalysis(self.analyse(board, limit, multipv=multipv or 1))
+
+    def play(self, board, limit=None, **kwargs):
+        return chess.engine.PlayResult(next(iter(board.legal_moves), None), None)
+
+    def configure(self, options):
+        pass
+
+    def quit(self):
+        pass
+
+    close = quit
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.quit()
+
+
+class StubClipboard:
+    def __init__(self, text):
+        self.text = text
+
+    def paste(self):
+        return self.text
+
+    def copy(self, text):
+        self.text = text
+
+
+def load_gui_module(path=GUI_PATH):
+    """
+    Imports code.py under the name top3_gui (importing it as "code" would clash with the
+    standard library module) and loads pygame with the dummy video and audio drivers.
+    """
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    spec = importlib.util.spec_from_file_location("top3_gui", path)
+    gui = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gui)
+    gui.load_gui()
+    return gui
+
+
+class FrameRecorder:
+    """
+    Replaces pygame.event.get. Every screen calls it once per frame, so the time between
+    two calls is one frame. script maps frame numbers to the events returned on that
+    frame; after frames frames a QUIT event ends the screen.
+    Ctrl counts as held on frames with a K_v key press, for the paste shortcut.
+    """
+    def __init__(self, pygame, script, frames, allocations=False):
+        self.pygame = pygame
+        self.script = script
+        self.frames = frames
+        self.allocations = allocations
+        self.times = []
+        self.allocated = []
+        self.last = None
+        self.mods = 0
+
+    def __call__(self, *args, **kwargs):
+        now = time.perf_counter()
+        if self.last is not None:
+            self.times.append(now - self.last)
+            if self.allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                self.allocated.append(peak - self.baseline)
+        frame = len(self.times)
+        if frame >= self.frames:
+            events = [self.pygame.event.Event(self.pygame.QUIT)]
+        else:
+            events = self.script.get(frame, [])
+        self.mods = self.pygame.KMOD_CTRL if any(
+            event.type == self.pygame.KEYDOWN and event.key == self.pygame.K_v for event in events
+        ) else 0
+        if self.allocations:
+            tracemalloc.reset_peak()
+            self.baseline = tracemalloc.get_traced_memory()[0]
+        self.last = time.perf_counter()
+        return events
+
+    def get_mods(self):
+        return self.mods
+
+    def summary(self):
+        times = np.array(self.times) * 1000
+        result = {
+            "frames": len(times),
+            "mean_ms": float(times.mean()) if len(times) else 0.0,
+            "p50_ms": float(np.percentile(times, 50)) if len(times) else 0.0,
+            "p95_ms": float(np.percentile(times, 95)) if len(times) else 0.0,
+            "max_ms": float(times.max()) if len(times) else 0.0,
+        }
+        if self.allocations and self.allocated:
+            allocated = np.array(self.allocated) / 1024
+            result["mean_kb"] = float(allocated.mean())
+            result["max_kb"] = float(allocated.max())
+        return result
+
+
+def click(pygame, pos):
+    return [
+        pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1),
+        pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1),
+    ]
+
+
+def key(pygame, key, unicode=""):
+    return [pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode=unicode, scancode=0)]
+
+
+def start_window_script(pygame, frames):
+    """Activate the text box, paste a game, then scroll it up, down, left and right."""
+    script = {1: click(pygame, (100, 150)), 3: key(pygame, pygame.K_v, "v")}
+    scroll_keys = [pygame.K_DOWN, pygame.K_DOWN, pygame.K_RIGHT, pygame.K_UP, pygame.K_LEFT]
+    for i, frame in enumerate(range(6, frames, 5)):
+        script[frame] = key(pygame, scroll_keys[i % len(scroll_keys)])
+    return script
+
+
+def mainmenu_script(pygame, frames):
+    """Move the mouse over the buttons without clicking."""
+    return {
+        frame: [pygame.event.Event(pygame.MOUSEMOTION, pos=(200, 140 + (frame * 7) % 300), rel=(0, 7), buttons=(0, 0, 0))]
+        for frame in range(1, frames, 2)
+    }
+
+
+def review_buttons(gui):
+    """Centres of the review screen's buttons, laid out like draw_board_with_highlight does."""
+    right_x = gui.BOARD_SIZE + gui.SIDE_PANEL_WIDTH // 2
+    right_width = gui.SIDE_PANEL_WIDTH // 2
+    bottom = gui.WINDOW_HEIGHT - 25 - 20
+    total = 50 + 20 + 50 + 20 + 25 + 20 + 25
+    retry_y = int(gui.WINDOW_HEIGHT - (total + int(gui.WINDOW_HEIGHT * 0.05)))
+    return {
+        "prev": (right_x + 20 + 35, bottom + 12),
+        "next": (right_x + right_width - 70 - 20 + 35, bottom + 12),
+        "retry": (right_x + right_width // 2, retry_y + 25),
+        "best": (right_x + right_width // 2, retry_y + 50 + 20 + 25),
+        "lines": (gui.BOARD_SIZE + 20 + 60, 90 + 16),
+    }
+
+
+def square_centre(gui, square, color):
+    file, rank = chess.square_file(square), chess.square_rank(square)
+    if color == "black":
+        file, rank = 7 - file, 7 - rank
+    size = gui.SQUARE_SIZE
+    return (file * size + size // 2, gui.EXTRA_HEIGHT + (7 - rank) * size + size // 2)
+
+
+def review_script(gui, pygame, frames, color):
+    """Cycle through next, previous, Best, Retry, the lines toggle and clicks on the board."""
+    buttons = review_buttons(gui)
+    board_squares = [chess.E2, chess.E4, chess.D1, chess.H5, chess.G1, chess.F3]
+    actions = [click(pygame, buttons[name]) for name in ("next", "prev", "best", "retry", "lines")]
+    actions += [click(pygame, square_centre(gui, square, color)) for square in board_squares]
+    return {frame: actions[i % len(actions)] for i, frame in enumerate(range(2, frames, 4))}
+
+
+def run_screen(gui, pygame, screen, script, frames, allocations):
+    recorder = FrameRecorder(pygame, script, frames, allocations)
+    get, get_mods = pygame.event.get, pygame.key.get_mods
+    pygame.event.get, pygame.key.get_mods = recorder, recorder.get_mods
+    try:
+        screen()
+    except SystemExit:
+        pass
+    finally:
+        pygame.event.get, pygame.key.get_mods = get, get_mods
+    return recorder.summary()
+
+
+def run(frames=200, allocations=False, gui_path=GUI_PATH):
+    """Runs the three screens for frames frames each and returns {screen name: summary}."""
+    gui = load_gui_module(gui_path)
+    pygame = gui.pygame
+    username = "yorubap"
+    color = gui.get_player_color(SAMPLE_PGN, username)
+    record = gui.analyse_game(SAMPLE_PGN, color, engine=StubEngine())
+    mistakes, accuracy = record.mistakes(), record.accuracy()
+    gui.pyperclip = StubClipboard(SAMPLE_PGN)
+    gui.MISTAKE_INDEX_PATH = None
+    popen_uci = chess.engine.SimpleEngine.popen_uci
+    chess.engine.SimpleEngine.popen_uci = lambda *args, **kwargs: StubEngine()
+    if allocations:
+        tracemalloc.start()
+    try:
+        return {
+            "start_window": run_screen(
+                gui, pygame, lambda: gui.start_window(username, "stub"),
+                start_window_script(pygame, frames), frames, allocations,
+            ),
+            "mainmenu": run_screen(
+                gui, pygame, lambda: gui.mainmenu(SAMPLE_PGN, color, "stub", mistakes, accuracy),
+                mainmenu_script(pygame, frames), frames, allocations,
+            ),
+            "review": run_screen(
+                gui, pygame,
+                lambda: gui.show_board_at_first_mistake_pygame(SAMPLE_PGN, color, "stub", "all", mistakes, accuracy),
+                review_script(gui, pygame, frames, color), frames, allocations,
+            ),
+        }
+    finally:
+        chess.engine.SimpleEngine.popen_uci = popen_uci
+        if allocations:
+            tracemalloc.stop()
+
+
+def regressions(results, baseline=None, tolerance=0.25, max_ms=None, max_kb=None):
+    """
+    Messages for every screen in results (as returned by run) whose p95 frame time or
+    mean allocation per frame is more than tolerance (a fraction) and NOISE above baseline
+    (results of an earlier run), or above max_ms / max_kb. An empty list means no regression.
+    """
+    failures = []
+    for name, summary in results.items():
+        checks = [("p95_ms", "p95 frame time", "ms", max_ms), ("mean_kb", "allocation per frame", "KB", max_kb)]
+        for field, label, unit, limit in checks:
+            if field not in summary:
+                continue
+            value = summary[field]
+            if limit is not None and value > limit:
+                failures.append(f"{name}: {label} {value:.2f} {unit} is over the limit of {limit:g} {unit}")
+            before = (baseline or {}).get(name, {}).get(field)
+            if before is not None and value > max(before * (1 + tolerance), before + NOISE[field]):
+                failures.append(
+                    f"{name}: {label} {value:.2f} {unit} is more than {tolerance:.0%} above the baseline {before:.2f} {unit}"
+                )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless frame-time benchmark of the dashboard screens")
+    parser.add_argument("--frames", type=int, default=200, help="Frames to run each screen for")
+    parser.add_argument("--allocations", action="store_true",
+                        help="Also report memory allocated per frame (tracemalloc, slows frames down)")
+    parser.add_argument("--gui", default=GUI_PATH, help="Path of the dashboard script")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Fail if results regressed against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed growth over the baseline as a fraction (default 0.25)")
+    parser.add_argument("--max-ms", type=float, help="Fail if any screen's p95 frame time is above this")
+    parser.add_argument("--max-kb", type=float, help="Fail if any screen's mean allocation per frame is above this")
+    args = parser.parse_args()
+    results = run(args.frames, args.allocations, args.gui)
+    for name, summary in results.items():
+        line = (
+            f"{name:<13} {summary['frames']:>5} frames  mean {summary['mean_ms']:7.2f} ms  "
+            f"p50 {summary['p50_ms']:7.2f} ms  p95 {summary['p95_ms']:7.2f} ms  max {summary['max_ms']:7.2f} ms"
+        )
+        if "mean_kb" in summary:
+            line += f"  alloc mean {summary['mean_kb']:8.1f} KB  max {summary['max_kb']:8.1f} KB"
+        print(line)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = regressions(results, baseline, args.tolerance, args.max_ms, args.max_kb)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Streaming ingest of PGN archives, plain or compressed (.gz, .bz2, .xz, .zst).
+
+Files are decompressed incrementally and split into one PGN string per game, so
+multi-GB exports are read with constant memory. With a username, games are picked
+on their White/Black headers alone, before any of their movetext is kept or parsed.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import re
+
+import chess.pgn
+
+from top3.core import pgn_parser, player_color
+
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+
+
+def open_pgn(path, binary=False):
+    """
+    Opens a PGN file for reading as text, decompressing on the fly by file extension.
+    With binary the raw (decompressed) bytes are returned instead, e.g. for byte offsets.
+    """
+    if path.endswith(".gz"):
+        stream = gzip.open(path, "rb")
+    elif path.endswith(".bz2"):
+        stream = bz2.open(path, "rb")
+    elif path.endswith(".xz"):
+        stream = lzma.open(path, "rb")
+    elif path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst archives needs zstandard: pip install zstandard")
+        # The zstandard reader cannot be iterated line by line on its own
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    else:
+        stream = open(path, "rb")
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+
+
+def game_texts(handle, username=None):
+    """
+    Yields the PGN text of each game in handle, a text stream.
+    With username only games where it played White or Black are yielded; the movetext
+    of the others is skipped line by line without being stored.
+    """
+    lines = []
+    headers = {}
+    in_moves = False
+    keep = True
+    for line in handle:
+        is_header = line.startswith("[")
+        if is_header and in_moves:
+            # A header after movetext starts the next game
+            if keep and lines:
+                yield "".join(lines)
+            lines, headers, in_moves, keep = [], {}, False, True
+        if is_header:
+            match = HEADER_PATTERN.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2)
+        elif line.strip() and not in_moves:
+            in_moves = True
+            if username is not None and player_color(headers, username) is None:
+                keep = False
+                lines = []
+        if keep:
+            lines.append(line)
+    if keep and in_moves and lines:
+        yield "".join(lines)
+
+
+def read_games(source, username=None, validate=False):
+    """
+    Yields the games of source (a path, see open_pgn, or a text stream) as chess.pgn.Game
+    objects, one at a time. With username only that player's games are parsed (see
+    game_texts), and with validate each game must first pass pgn_parser, the same check
+    as a pasted PGN; games that fail it are skipped.
+    """
+    handle = open_pgn(source) if isinstance(source, str) else source
+    try:
+        for text in game_texts(handle, username):
+            if validate and not pgn_parser(text)[0]:
+                continue
+            game = chess.pgn.read_game(io.StringIO(text))
+            if game is not None:
+                yield game
+    finally:
+        if isinstance(source, str):
+            handle.close()
@@ -0,0 +1,101 @@
+"""
+Memory instrumentation and limits for long-running processes (batch runs, the server).
+
+MemoryProfiler takes tracemalloc snapshots around named stages and reports what each
+stage allocated, together with the process's peak RSS. RSS is only reported: it cannot
+be read everywhere (Windows) and rarely goes down after a cache is emptied, so caches
+bound themselves instead, by entries and by approximate_size of what they hold.
+"""
+import os
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """Current resident set size in MB (Linux), falling back to the peak elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def approximate_size(value):
+    """Rough size in bytes of value and the tuples, lists and dicts it holds."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(approximate_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(approximate_size(key) + approximate_size(item) for key, item in value.items())
+    return size
+
+
+class MemoryProfiler:
+    """
+    Accumulates, per stage name, the memory allocated by the code run in stage(name)
+    blocks and the largest allocation sites. Does nothing unless enabled, so it can be
+    left in place in production code.
+    """
+    def __init__(self, enabled=True, top=3):
+        self.enabled = enabled
+        self.top = top
+        self.stages = {}
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _snapshot(self):
+        # Leave out the profiler's own bookkeeping
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        before = self._snapshot()
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            after = self._snapshot()
+            stats = after.compare_to(before, "lineno")
+            entry = self.stages.setdefault(name, {"calls": 0, "retained": 0, "peak": 0, "sites": {}})
+            entry["calls"] += 1
+            entry["retained"] += current - start
+            entry["peak"] = max(entry["peak"], peak - start)
+            for stat in stats[:self.top]:
+                site = str(stat.traceback[0])
+                entry["sites"][site] = entry["sites"].get(site, 0) + stat.size_diff
+
+    def report(self):
+        """Text report of every stage, largest allocation sites first, and the peak RSS."""
+        lines = []
+        for name, entry in self.stages.items():
+            lines.append(
+                f"{name}: {entry['calls']} calls, retained {entry['retained'] / 1024:.1f} KB, "
+                f"peak {entry['peak'] / 1024:.1f} KB"
+            )
+            sites = sorted(entry["sites"].items(), key=lambda item: -item[1])[:self.top]
+            for site, size in sites:
+                lines.append(f"    {size / 1024:+.1f} KB  {site}")
+        rss = peak_rss_mb()
+        lines.append(f"peak RSS: {rss:.1f} MB" if rss is not None else "peak RSS: unavailable")
+        return "\n".join(lines)
@@ -0,0 +1,221 @@
+"""
+Persistent index of mistake positions across games: "have I made this mistake before?"
+
+    python -m top3.mistakeindex mistakes.idx --top 10
+
+Each entry is one mistake: the position before it (Zobrist hash, and a signature of
+the material and pawn structure so similar positions match too), the game, the move,
+the eval drop and the phase. Entries are appended to a table file (see top3.store),
+so the index grows game by game, and lookups are binary searches on sorted columns.
+New entries are merged into the sorted columns on the next lookup, not on every add.
+"""
+import argparse
+import hashlib
+import os
+import threading
+
+import chess
+import chess.polyglot
+import numpy as np
+
+from top3.phase import classify as classify_phase
+from top3.record import PHASE_NAMES, decode_move, encode_move
+from top3.store import append_table, open_table
+
+MISTAKE_DTYPE = np.dtype([
+    ("position", "<u8"),   # Zobrist hash of the position before the mistake
+    ("signature", "<u8"),  # structure_signature of that position
+    ("game", "S20"),       # game_hash as raw SHA-1 bytes
+    ("drop", "<f4"),       # eval change in pawns, negative
+    ("move", "<u2"),       # encode_move of the mistake
+    ("phase", "u1"),
+    ("color", "u1"),       # 1 for White's mistakes, 0 for Black's
+    ("fen", "S92"),
+])
+
+PIECE_TYPES = (chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN)
+
+
+def structure_signature(board):
+    """
+    64-bit signature of the material and pawn structure of board: positions with the same
+    pawns and the same number of each piece match, wherever the pieces stand.
+    """
+    parts = [board.pawns & board.occupied_co[color] for color in chess.COLORS]
+    parts += [
+        chess.popcount(board.pieces_mask(piece_type, color))
+        for color in chess.COLORS
+        for piece_type in PIECE_TYPES
+    ]
+    data = b"".join(part.to_bytes(8, "little") for part in parts)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def _padded(game):
+    # numpy strips trailing NUL bytes from S20 values
+    return game.ljust(20, b"\0")
+
+
+class MistakeIndex:
+    """
+    The mistake index stored at path, created (with its directory) on the first add.
+    Each mistake is added once: adding a game's mistakes again only adds the ones not
+    already indexed for that game, so a game first indexed with its top 3 mistakes
+    can be completed later.
+    One instance can be shared between threads (e.g. the dashboard and its background
+    analysis): adds and lookups are locked, so no write is lost.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = open_table(self.path, MISTAKE_DTYPE)
+        games = [_padded(game) for game in self.entries["game"].tolist()]
+        self.games = set(games)
+        self._keys = set(zip(games, self.entries["position"].tolist(), self.entries["move"].tolist()))
+        # Sorted copies of the key columns for binary search
+        self._by_position = np.argsort(self.entries["position"], kind="stable")
+        self._positions = np.asarray(self.entries["position"])[self._by_position]
+        self._by_signature = np.argsort(self.entries["signature"], kind="stable")
+        self._signatures = np.asarray(self.entries["signature"])[self._by_signature]
+        # Rows added since the sorted columns were last brought up to date
+        self._pending = []
+        self._trimmed = False
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries) + sum(len(rows) for rows in self._pending)
+
+    def _merge(self):
+        """Appends the pending rows to entries and inserts their keys into the sorted columns."""
+        if not self._pending:
+            return
+        rows = np.concatenate(self._pending)
+        self._pending = []
+        start = len(self.entries)
+        self.entries = np.concatenate([self.entries, rows])
+        for column, values, order in (("position", "_positions", "_by_position"),
+                                      ("signature", "_signatures", "_by_signature")):
+            new_order = np.argsort(rows[column], kind="stable")
+            new_values = rows[column][new_order]
+            at = np.searchsorted(getattr(self, values), new_values, side="right")
+            setattr(self, values, np.insert(getattr(self, values), at, new_values))
+            setattr(self, order, np.insert(getattr(self, order), at, start + new_order))
+
+    def add_game(self, key, mistakes):
+        """
+        Adds the mistakes of the game with game_hash key, given as (board before the move,
+        move, eval change) tuples. Returns False if all of them were already indexed.
+        """
+        with self.lock:
+            game = bytes.fromhex(key)
+            new = []
+            for board, move, change in mistakes:
+                position, encoded = chess.polyglot.zobrist_hash(board), encode_move(move)
+                if (game, position, encoded) not in self._keys:
+                    self._keys.add((game, position, encoded))
+                    new.append((position, board, move, change))
+            if not new:
+                return False
+            rows = np.zeros(len(new), dtype=MISTAKE_DTYPE)
+            for row, (position, board, move, change) in zip(rows, new):
+                row["position"] = position
+                row["signature"] = structure_signature(board)
+                row["game"] = game
+                row["drop"] = change
+                row["move"] = encode_move(move)
+                row["phase"] = classify_phase(board)
+                row["color"] = board.turn == chess.WHITE
+                row["fen"] = board.fen().encode()
+            if not self._trimmed:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # The first add drops any torn row left by an interrupted write
+                append_table(self.path, MISTAKE_DTYPE, len(self)).close()
+                self._trimmed = True
+            with open(self.path, "ab") as f:
+                f.write(rows.tobytes())
+            self.games.add(game)
+            self._pending.append(rows)
+            return True
+
+    def add_record(self, record, key, threshold=0.2):
+        """Adds every mistake of a GameRecord by its player."""
+        mask, changes = record.mistake_mask(threshold=threshold)
+        board = chess.Board(record.start_fen)
+        mistakes = []
+        for i, played in enumerate(record.played):
+            move = decode_move(played)
+            if mask[i]:
+                mistakes.append((board.copy(stack=False), move, float(changes[i])))
+            board.push(move)
+        return self.add_game(key, mistakes)
+
+    def _lookup(self, values, order, value):
+        start, end = np.searchsorted(values, value, side="left"), np.searchsorted(values, value, side="right")
+        return self.entries[order[start:end]]
+
+    def same_position(self, board):
+        """Entries for mistakes made in exactly this position."""
+        with self.lock:
+            self._merge()
+            return self._lookup(self._positions, self._by_position, chess.polyglot.zobrist_hash(board))
+
+    def similar(self, board):
+        """Entries for mistakes made in positions with the same material and pawn structure."""
+        with self.lock:
+            self._merge()
+            return self._lookup(self._signatures, self._by_signature, structure_signature(board))
+
+    def other_games(self, board, key=None, similar=True):
+        """Number of games, other than the one with game_hash key, with a mistake in a matching position."""
+        entries = self.similar(board) if similar else self.same_position(board)
+        games = {_padded(game) for game in entries["game"].tolist()}
+        if key is not None:
+            games.discard(bytes.fromhex(key))
+        return len(games)
+
+    def recurring(self, top=10, similar=True):
+        """
+        The top most recurring mistake positions as (number of games, entries) pairs,
+        matching positions by structure_signature (or exactly, with similar=False).
+        """
+        with self.lock:
+            self._merge()
+            # Merges replace entries rather than change it, so this copy stays consistent
+            entries = self.entries
+        keys = np.asarray(entries["signature" if similar else "position"])
+        if not len(keys):
+            return []
+        _, game_ids = np.unique(np.asarray(entries["game"]), return_inverse=True)
+        order = np.lexsort((game_ids, keys))
+        keys, game_ids = keys[order], game_ids[order]
+        # One count per distinct (position, game) pair
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1]) | (game_ids[1:] != game_ids[:-1])
+        values, counts = np.unique(keys[first], return_counts=True)
+        ranked = np.argsort(-counts, kind="stable")[:top]
+        column = "signature" if similar else "position"
+        return [
+            (int(counts[i]), entries[np.asarray(entries[column]) == values[i]])
+            for i in ranked
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Most recurring mistakes in a mistake index")
+    parser.add_argument("index", help="Mistake index file (see top3.batch --mistakes)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--exact", action="store_true", help="Match identical positions only")
+    args = parser.parse_args()
+    index = MistakeIndex(args.index)
+    print(f"{len(index)} mistakes in {len(index.games)} games")
+    for games, entries in index.recurring(args.top, similar=not args.exact):
+        worst = entries[np.argmin(entries["drop"])]
+        board = chess.Board(worst["fen"].decode())
+        move = board.san(decode_move(worst["move"]))
+        print(f"{games} games, e.g. {move} ({worst['drop']:+.2f}, {PHASE_NAMES[worst['phase']]}) in {board.fen()}")
+
+
+if __name__ == "__main__":
+    main()
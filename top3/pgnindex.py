@@ -0,0 +1,151 @@
+"""
+Header-only index of a PGN file, kept next to it as <file>.idx.npz.
+
+One pass over the file records, for every game, its byte offset and length and its
+White, Black, Date and Result headers; no movetext is parsed. Later runs load the
+index and seek straight to the games of one player, skipping everyone else's.
+Offsets are into the decompressed bytes, so compressed archives work too, though
+seeking in them means decompressing up to the offset (.zst streams cannot seek at
+all, so they are read forward to it).
+"""
+import io
+import os
+
+import chess.pgn
+import numpy as np
+
+from top3.ingest import HEADER_PATTERN, open_pgn
+
+INDEXED_HEADERS = ("White", "Black", "Date", "Result")
+
+
+def index_path(pgn_path):
+    return pgn_path + ".idx.npz"
+
+
+def scan_headers(stream):
+    """
+    Yields (offset, length, headers) for each game in stream, a binary file object.
+    headers only holds INDEXED_HEADERS.
+    """
+    offset = 0
+    start = None
+    headers = {}
+    in_moves = False
+    for line in stream:
+        if line.startswith(b"["):
+            if in_moves or start is None:
+                if start is not None:
+                    yield start, offset - start, headers
+                start, headers, in_moves = offset, {}, False
+            match = HEADER_PATTERN.match(line.decode("utf-8", "replace"))
+            if match and match.group(1) in INDEXED_HEADERS:
+                headers[match.group(1)] = match.group(2)
+        elif line.strip() and start is not None:
+            in_moves = True
+        offset += len(line)
+    if start is not None:
+        yield start, offset - start, headers
+
+
+def _skip(stream, count):
+    """Reads past count bytes of a stream that cannot seek."""
+    while count > 0:
+        chunk = stream.read(min(count, 1 << 20))
+        if not chunk:
+            return
+        count -= len(chunk)
+
+
+class PgnIndex:
+    """
+    Columns offset, length, white, black, date and result, one entry per game, plus the
+    size and modification time of the PGN file they were built from.
+    """
+    def __init__(self, columns, source_size, source_mtime):
+        self.columns = columns
+        self.source_size = source_size
+        self.source_mtime = source_mtime
+        # Names compared the way player_color does
+        self._white = np.char.lower(np.char.strip(columns["white"]))
+        self._black = np.char.lower(np.char.strip(columns["black"]))
+
+    def __len__(self):
+        return len(self.columns["offset"])
+
+    @classmethod
+    def build(cls, pgn_path):
+        stat = os.stat(pgn_path)
+        entries = {name: [] for name in ("offset", "length") + tuple(h.lower() for h in INDEXED_HEADERS)}
+        with open_pgn(pgn_path, binary=True) as stream:
+            for offset, length, headers in scan_headers(stream):
+                entries["offset"].append(offset)
+                entries["length"].append(length)
+                for header in INDEXED_HEADERS:
+                    entries[header.lower()].append(headers.get(header, ""))
+        columns = {
+            name: np.array(values, dtype=np.int64 if name in ("offset", "length") else np.str_)
+            for name, values in entries.items()
+        }
+        return cls(columns, stat.st_size, stat.st_mtime)
+
+    def save(self, path):
+        np.savez(path, source_size=self.source_size, source_mtime=self.source_mtime, **self.columns)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files if not name.startswith("source_")}
+            return cls(columns, int(data["source_size"]), float(data["source_mtime"]))
+
+    def is_current(self, pgn_path):
+        stat = os.stat(pgn_path)
+        return stat.st_size == self.source_size and stat.st_mtime == self.source_mtime
+
+    def select(self, username, color=None):
+        """Positions of the games username played, with color ('white' or 'black') if given."""
+        name = username.strip().lower()
+        if color is None:
+            mask = (self._white == name) | (self._black == name)
+        elif color.lower() == "white":
+            mask = self._white == name
+        else:
+            mask = self._black == name
+        return np.flatnonzero(mask)
+
+    def read(self, pgn_path, positions):
+        """Yields the games at positions (in file order), seeking past all the others."""
+        positions = np.sort(positions)
+        with open_pgn(pgn_path, binary=True) as stream:
+            seekable = stream.seekable()
+            at = 0
+            for i in positions:
+                offset = int(self.columns["offset"][i])
+                if seekable:
+                    stream.seek(offset)
+                else:
+                    _skip(stream, offset - at)
+                length = int(self.columns["length"][i])
+                text = stream.read(length).decode("utf-8", "replace")
+                at = offset + length
+                game = chess.pgn.read_game(io.StringIO(text))
+                if game is not None:
+                    yield game
+
+
+def load_index(pgn_path):
+    """The index of pgn_path, built and saved next to it if missing or out of date."""
+    path = index_path(pgn_path)
+    if os.path.exists(path):
+        index = PgnIndex.load(path)
+        if index.is_current(pgn_path):
+            return index
+    index = PgnIndex.build(pgn_path)
+    index.save(path)
+    return index
+
+
+def player_games(pgn_path, username, color=None):
+    """Yields username's games in pgn_path through its index."""
+    index = load_index(pgn_path)
+    return index.read(pgn_path, index.select(username, color))
@@ -0,0 +1,91 @@
+from collections import namedtuple
+
+import chess
+import numpy as np
+
+from top3.record import ENDGAME, MIDDLEGAME, OPENING, decode_move
+
+# Rules deciding the game phase of a position:
+# - opening_moves: positions up to this full move number are the opening
+# - endgame_pieces: endgame once both sides have at most this many queens/rooks/bishops/knights
+# - endgame_material: if set, endgame also once both sides have at most this much
+#   non-pawn material (knight/bishop 3, rook 5, queen 9)
+PhaseRules = namedtuple("PhaseRules", ["opening_moves", "endgame_pieces", "endgame_material"])
+DEFAULT_RULES = PhaseRules(opening_moves=10, endgame_pieces=2, endgame_material=None)
+
+
+def piece_counts(board):
+    """
+    Returns (white, black) counts of queens, rooks, bishops and knights,
+    read straight from the board's bitboards with popcount.
+    """
+    pieces = board.occupied & ~(board.pawns | board.kings)
+    return (
+        chess.popcount(pieces & board.occupied_co[chess.WHITE]),
+        chess.popcount(pieces & board.occupied_co[chess.BLACK]),
+    )
+
+
+def material(board, color):
+    """Non-pawn material of color in pawn units."""
+    own = board.occupied_co[color]
+    return (
+        3 * chess.popcount((board.knights | board.bishops) & own)
+        + 5 * chess.popcount(board.rooks & own)
+        + 9 * chess.popcount(board.queens & own)
+    )
+
+
+def is_endgame_position(board, rules=DEFAULT_RULES):
+    white, black = piece_counts(board)
+    if white <= rules.endgame_pieces and black <= rules.endgame_pieces:
+        return True
+    if rules.endgame_material is not None:
+        return (
+            material(board, chess.WHITE) <= rules.endgame_material
+            and material(board, chess.BLACK) <= rules.endgame_material
+        )
+    return False
+
+
+def classify(board, rules=DEFAULT_RULES):
+    """Phase flag (OPENING, MIDDLEGAME or ENDGAME) of the position on board."""
+    if board.fullmove_number <= rules.opening_moves:
+        return OPENING
+    if is_endgame_position(board, rules):
+        return ENDGAME
+    return MIDDLEGAME
+
+
+def classify_moves(board, moves, rules=DEFAULT_RULES):
+    """
+    Classifies the position before each move in one pass over the game,
+    returning a uint8 array with one phase flag per ply. board is left unchanged.
+    """
+    board = board.copy(stack=False)
+    phases = []
+    for move in moves:
+        phases.append(classify(board, rules))
+        board.push(move)
+    return np.array(phases, dtype=np.uint8)
+
+
+def classify_game(game, rules=DEFAULT_RULES):
+    """Phase flag of every ply of a chess.pgn.Game's mainline."""
+    return classify_moves(game.board(), game.mainline_moves(), rules)
+
+
+def classify_record(record, rules=DEFAULT_RULES):
+    """
+    Recomputes the phase column of a GameRecord under other rules from its stored moves,
+    e.g. to pass as phases to the functions in top3.stats.
+    """
+    moves = [decode_move(value) for value in record.played]
+    return classify_moves(chess.Board(record.start_fen), moves, rules)
+
+
+def classify_records(records, rules=DEFAULT_RULES):
+    """Phase flags for many records, concatenated in the same order as stats.archive_arrays."""
+    return np.concatenate(
+        [np.zeros(0, np.uint8)] + [classify_record(record, rules) for record in records]
+    )
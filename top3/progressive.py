@@ -0,0 +1,134 @@
+"""
+Progressive analysis: a provisional result within about a second, refined in the background.
+
+The first pass searches every position of the game once with a small fixed number of
+nodes, which is enough for a provisional top 3 and accuracy. A background thread then
+re-searches every ply of the player with the same searches as find_mistakes, always
+taking next the ply that looks worst on the evals so far, so the likely mistakes are
+settled first. The result can be read again at any time while it improves; once every
+ply is refined it is the same as find_mistakes'.
+"""
+import threading
+
+import chess
+import chess.engine
+
+from top3.core import best_move_search, eval_search
+from top3.engines import open_engine
+from top3.phase import classify as classify_phase
+from top3.record import GameRecord, encode_move, eval_changes, score_columns
+
+
+class ProgressiveAnalysis:
+    """
+    Analyses game for color on its own engine started from stockfish_path.
+    The constructor runs the first pass; start() begins refining in a background thread.
+    candidates holds the plies of color to refine and refined how many are done; complete
+    is True once all of them are.
+    version goes up each time the result changes, for callers polling from a UI loop.
+    """
+    def __init__(self, game, color, stockfish_path, nodes=2000, threshold=0.2, engine_options=None):
+        self.color = color.lower()
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.version = 0
+        self.refined = 0
+        self.candidates = []
+        # Position before each ply, and the final position
+        moves = list(game.mainline_moves())
+        board = game.board()
+        self.boards = [board.copy(stack=False)]
+        for move in moves:
+            board.push(move)
+            self.boards.append(board.copy(stack=False))
+        self.engine = open_engine(stockfish_path, engine_options)
+        try:
+            self.record = self._first_pass(moves, nodes)
+        except Exception:
+            self.engine.quit()
+            raise
+        self._evaluated = set()
+        sign = self.record.sign()
+        self.candidates = [int(i) for i in (self.record.side == (1 if sign == 1 else 0)).nonzero()[0]]
+        self._remaining = set(self.candidates)
+
+    def _first_pass(self, moves, nodes):
+        # One search per position gives both the best move before a ply and the eval after the previous one
+        results = []
+        for board in self.boards:
+            info = self.engine.analyse(board, chess.engine.Limit(nodes=nodes))
+            results.append((info.get("pv", [None])[0], score_columns(info["score"])))
+        plies = []
+        for ply, move in enumerate(moves):
+            board = self.boards[ply]
+            best_move = results[ply][0]
+            score, mate = results[ply + 1][1]
+            plies.append((ply, board.turn, score, mate, best_move, move, classify_phase(board)))
+        return GameRecord.from_plies(plies, self.color, self.boards[0].fen())
+
+    def _next_ply(self):
+        """The unrefined ply of the player with the largest eval drop on the current evals."""
+        with self.lock:
+            _, changes, is_mate = eval_changes(self.record.score, self.record.mate, self.record.sign())
+        # Mate swings go last, as mistakes() leaves them out anyway
+        return min(self._remaining, key=lambda ply: (bool(is_mate[ply]), changes[ply], ply))
+
+    def _evaluate(self, index):
+        """Full-strength eval of boards[index], stored as the score of the ply leading to it."""
+        if index == 0 or index in self._evaluated:
+            return
+        score, mate = eval_search(self.engine, self.boards[index])
+        with self.lock:
+            self.record.score[index - 1] = score
+            self.record.mate[index - 1] = mate
+        self._evaluated.add(index)
+
+    def _refine(self):
+        try:
+            while self._remaining and not self.stopped.is_set():
+                ply = self._next_ply()
+                best_move = best_move_search(self.engine, self.boards[ply])
+                self._evaluate(ply)
+                self._evaluate(ply + 1)
+                with self.lock:
+                    self.record.best[ply] = encode_move(best_move)
+                    self.refined += 1
+                    self.version += 1
+                self._remaining.discard(ply)
+        finally:
+            self.engine.quit()
+
+    def start(self):
+        """Starts refining in a daemon thread."""
+        self.thread = threading.Thread(target=self._refine, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops refining after the current search and releases the engine."""
+        was_stopped = self.stopped.is_set()
+        self.stopped.set()
+        if self.thread is None:
+            if not was_stopped:
+                self.engine.quit()
+        elif self.thread is not threading.current_thread():
+            self.thread.join()
+
+    @property
+    def finished(self):
+        return self.thread is not None and not self.thread.is_alive()
+
+    @property
+    def complete(self):
+        """True once every ply has been refined, i.e. the result is final."""
+        return not self._remaining
+
+    def result(self):
+        """(mistakes, accuracy) as returned by find_mistakes, from the current state of the analysis."""
+        with self.lock:
+            return (
+                self.record.mistakes(threshold=self.threshold),
+                self.record.accuracy(threshold=self.threshold),
+            )
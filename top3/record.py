@@ -0,0 +1,223 @@
+import chess
+import numpy as np
+
+# Game phase flags stored per ply
+OPENING = 0
+MIDDLEGAME = 1
+ENDGAME = 2
+PHASE_NAMES = ["opening", "middlegame", "endgame"]
+
+# Mate column value for plies whose evaluation is not a forced mate
+NO_MATE = np.iinfo(np.int16).min
+
+# Column name -> dtype of the per-ply arrays
+COLUMNS = {
+    "ply": np.uint16,     # index of the move in the mainline, starting at 0
+    "side": np.uint8,     # 1 if White made the move, 0 if Black
+    "score": np.int32,    # centipawns after the move, White's point of view (0 for mates)
+    "mate": np.int16,     # mate distance after the move, White's point of view, or NO_MATE
+    "best": np.uint16,    # engine best move in the position before the move (encode_move)
+    "played": np.uint16,  # move actually played (encode_move)
+    "phase": np.uint8,    # OPENING, MIDDLEGAME or ENDGAME for the position before the move
+}
+
+
+def encode_move(move):
+    """
+    Packs a move into 16 bits: from-square, to-square and promotion piece.
+    0 is used for "no move" (a1a1 can never be a legal move).
+    """
+    if move is None:
+        return 0
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(value):
+    """Inverse of encode_move, returns None for 0."""
+    value = int(value)
+    if value == 0:
+        return None
+    promotion = (value >> 12) & 7
+    return chess.Move(value & 63, (value >> 6) & 63, promotion or None)
+
+
+def score_columns(score):
+    """Returns the (score, mate) column values for an engine PovScore."""
+    s = score.white()
+    if s.is_mate():
+        return 0, s.mate()
+    return s.score(), NO_MATE
+
+
+def eval_changes(score, mate, sign, starts=None):
+    """
+    Returns (evals, changes, is_mate) for the player whose perspective is given by sign
+    (+1 White, -1 Black, scalar or per ply).
+    evals are pawns after each ply, changes are evals minus the previous ply's eval.
+    Like find_mistakes always did, the previous eval counts as 0 at the start of a game
+    (each index in starts) and after a mate score.
+    """
+    is_mate = mate != NO_MATE
+    evals = score * sign / 100.0
+    after = np.where(is_mate, 0.0, evals)
+    before = np.empty_like(after)
+    before[:1] = 0.0
+    before[1:] = after[:-1]
+    if starts is not None:
+        before[starts] = 0.0
+    return evals, evals - before, is_mate
+
+
+class GameRecord:
+    """
+    Columnar per-ply analysis of one game, stored in NumPy arrays (see COLUMNS).
+    Every ply of the game is kept, not only the mistakes, so mistake lists, accuracy
+    and evaluation graphs can all be derived from the record without the engine.
+    A 60 move game takes under 2 KB.
+    """
+    def __init__(self, columns, color, start_fen=chess.STARTING_FEN):
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+        self.color = color.lower()
+        self.start_fen = start_fen
+        self._sans = None
+
+    @classmethod
+    def from_plies(cls, plies, color, start_fen=chess.STARTING_FEN):
+        """
+        Builds a record from a list of per-ply tuples in COLUMNS order,
+        with the best and played moves given as chess.Move objects (or None).
+        """
+        columns = {name: [] for name in COLUMNS}
+        for ply in plies:
+            for name, value in zip(COLUMNS, ply):
+                if name in ("best", "played"):
+                    value = encode_move(value)
+                columns[name].append(value)
+        return cls(columns, color, start_fen)
+
+    def for_color(self, color):
+        """The same analysis seen from the other player's side (the columns are shared)."""
+        record = GameRecord({name: getattr(self, name) for name in COLUMNS}, color, self.start_fen)
+        record._sans = self._sans
+        return record
+
+    def __len__(self):
+        return len(self.ply)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in COLUMNS)
+
+    def sign(self, color=None):
+        color = (color or self.color).lower()
+        return 1 if color == "white" else -1
+
+    def move_numbers(self):
+        """Full move number of each ply."""
+        board = chess.Board(self.start_fen)
+        offset = 0 if board.turn == chess.WHITE else 1
+        return board.fullmove_number + (self.ply.astype(np.int32) + offset) // 2
+
+    def sans(self):
+        """SAN of every played move, computed once by replaying the game."""
+        if self._sans is None:
+            board = chess.Board(self.start_fen)
+            self._sans = []
+            for value in self.played:
+                move = decode_move(value)
+                self._sans.append(board.san(move))
+                board.push(move)
+        return self._sans
+
+    def evals(self, color=None, mate_score=None):
+        """
+        Evaluation after each ply in pawns from color's point of view (the player by default).
+        Mates are reported as NaN unless mate_score (in pawns) is given, which is useful for graphs.
+        """
+        sign = self.sign(color)
+        evals = self.score * sign / 100.0
+        is_mate = self.mate != NO_MATE
+        if mate_score is None:
+            return np.where(is_mate, np.nan, evals)
+        mate_sign = np.where(self.mate.astype(np.int32) * sign < 0, -1.0, 1.0)
+        return np.where(is_mate, mate_sign * mate_score, evals)
+
+    def mistake_mask(self, color=None, threshold=0.2):
+        """
+        Boolean mask of the plies that are mistakes by color: the eval drops by more than
+        threshold pawns and the move is not the engine's best move. Mate scores are skipped.
+        Also returns the changes in evaluation.
+        """
+        sign = self.sign(color)
+        _, changes, is_mate = eval_changes(self.score, self.mate, sign)
+        mask = (
+            (self.side == (1 if sign == 1 else 0))
+            & (self.played != self.best)
+            & ~is_mate
+            & (changes < -threshold)
+        )
+        return mask, changes
+
+    def accuracy(self, color=None, threshold=0.2):
+        """1 - total penalty / number of moves, each penalty capped at 1 pawn."""
+        if len(self) == 0:
+            return 1.0
+        mask, changes = self.mistake_mask(color, threshold)
+        total_penalty = np.minimum(-changes[mask], 1.0).sum()
+        move_number = int(self.move_numbers()[-1])
+        return max(0.0, 1 - (float(total_penalty) / move_number))
+
+    def mistakes(self, color=None, threshold=0.2, top=3):
+        """
+        Returns the same dictionary as find_mistakes: keys 'all', 'opening', 'middlegame',
+        'endgame', each a list of up to top tuples (move_number, move, evaluation, change)
+        sorted worst first.
+        """
+        mask, changes = self.mistake_mask(color, threshold)
+        evals = self.score * self.sign(color) / 100.0
+        move_numbers = self.move_numbers()
+        result = {"all": []}
+        for name in PHASE_NAMES:
+            result[name] = []
+        indices = np.flatnonzero(mask)
+        # Stable sort keeps game order between equal changes
+        indices = indices[np.argsort(changes[indices], kind="stable")]
+        sans = self.sans() if len(indices) else []
+        for i in indices:
+            entry = (int(move_numbers[i]), sans[i], float(evals[i]), float(changes[i]))
+            for key in ("all", PHASE_NAMES[self.phase[i]]):
+                if len(result[key]) < top:
+                    result[key].append(entry)
+        return result
+
+    def to_dict(self):
+        columns = {name: getattr(self, name) for name in COLUMNS}
+        columns["color"] = np.array(self.color)
+        columns["start_fen"] = np.array(self.start_fen)
+        return columns
+
+    def save(self, path):
+        """Writes the record to a compressed .npz file."""
+        np.savez_compressed(path, **self.to_dict())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in COLUMNS}
+            return cls(columns, str(data["color"]), str(data["start_fen"]))
+
+    def to_arrow(self):
+        """Returns the record as a pyarrow Table, with color and start FEN in the schema metadata."""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("Arrow export needs pyarrow: pip install pyarrow")
+        table = pa.table({name: getattr(self, name) for name in COLUMNS})
+        return table.replace_schema_metadata({"color": self.color, "start_fen": self.start_fen})
+
+    @classmethod
+    def from_arrow(cls, table):
+        metadata = table.schema.metadata
+        columns = {name: table.column(name).to_numpy() for name in COLUMNS}
+        return cls(columns, metadata[b"color"].decode(), metadata[b"start_fen"].decode())
@@ -0,0 +1,152 @@
+"""
+Offscreen rendering of mistake positions to PNG or SVG files for batch reports.
+PNGs are drawn with pygame under SDL's dummy video driver and SVGs with chess.svg,
+so neither needs a display. pygame is only imported in the processes drawing PNGs.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.svg
+
+from top3.record import decode_move
+
+# Same colours as the review screen
+LIGHT_SQUARE = (240, 217, 181)
+DARK_SQUARE = (181, 136, 99)
+HIGHLIGHT_SQUARE = (210, 180, 140)
+
+_pygame = None
+_images = {}
+
+
+def _load_pygame(square_size):
+    """Imports pygame on the dummy video driver and the piece sprites for square_size."""
+    global _pygame
+    if _pygame is None:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import pygame
+        pygame.display.init()
+        # A tiny display surface lets the sprites be converted for fast blits
+        if pygame.display.get_surface() is None:
+            pygame.display.set_mode((1, 1))
+        _pygame = pygame
+    if square_size not in _images:
+        from top3 import sprites
+        _images[square_size] = sprites.piece_images(square_size)
+    return _pygame, _images[square_size]
+
+
+def _screen_square(square, player_color, square_size):
+    file = chess.square_file(square)
+    rank = chess.square_rank(square)
+    # Flip the board if black is at the bottom
+    display_file = file if player_color == "white" else 7 - file
+    display_rank = rank if player_color == "white" else 7 - rank
+    return display_file * square_size, (7 - display_rank) * square_size
+
+
+def draw_position(surface, board, move=None, player_color="white", square_size=60, images=None):
+    """
+    Draws board on surface like draw_board_with_highlight does on the review screen:
+    squares, from/to highlight of move, then the pieces.
+    """
+    pygame = _pygame
+    for square in chess.SQUARES:
+        x, y = _screen_square(square, player_color, square_size)
+        light = (chess.square_file(square) + chess.square_rank(square)) % 2
+        surface.fill(LIGHT_SQUARE if light else DARK_SQUARE, pygame.Rect(x, y, square_size, square_size))
+    if move is not None:
+        for square in (move.from_square, move.to_square):
+            x, y = _screen_square(square, player_color, square_size)
+            surface.fill(HIGHLIGHT_SQUARE, pygame.Rect(x, y, square_size, square_size))
+    for square, piece in board.piece_map().items():
+        color = 'w' if piece.color == chess.WHITE else 'b'
+        surface.blit(images[color + piece.symbol().lower()], _screen_square(square, player_color, square_size))
+
+
+def render_png(board, path, move=None, player_color="white", square_size=60):
+    """Renders board (with move highlighted) to a PNG file without a display."""
+    pygame, images = _load_pygame(square_size)
+    surface = pygame.Surface((square_size * 8, square_size * 8))
+    draw_position(surface, board, move, player_color, square_size, images)
+    pygame.image.save(surface, path)
+    return path
+
+
+def render_svg(board, path, move=None, player_color="white", square_size=60):
+    """Renders board (with move highlighted) to an SVG file with chess.svg."""
+    fill = {}
+    if move is not None:
+        fill = {move.from_square: "#d2b48c", move.to_square: "#d2b48c"}
+    svg = chess.svg.board(
+        board,
+        orientation=chess.WHITE if player_color == "white" else chess.BLACK,
+        fill=fill,
+        size=square_size * 8,
+        coordinates=False,
+    )
+    with open(path, "w") as f:
+        f.write(svg)
+    return path
+
+
+def mistake_jobs(record, name, threshold=0.2, top=None):
+    """
+    Returns render jobs (name, fen, move_uci, player_color) for the mistakes in a GameRecord,
+    worst first. The position is the one after the mistake, as on the review screen.
+    """
+    mask, changes = record.mistake_mask(threshold=threshold)
+    indices = [int(i) for i in mask.nonzero()[0]]
+    indices.sort(key=lambda i: changes[i])
+    if top is not None:
+        indices = indices[:top]
+    wanted = set(indices)
+    fens = {}
+    board = chess.Board(record.start_fen)
+    for i, value in enumerate(record.played):
+        if not wanted:
+            break
+        board.push(decode_move(value))
+        if i in wanted:
+            fens[i] = board.fen()
+            wanted.discard(i)
+    move_numbers = record.move_numbers()
+    return [
+        (f"{name}_{move_numbers[i]}{'w' if record.side[i] else 'b'}", fens[i],
+         decode_move(record.played[i]).uci(), record.color)
+        for i in indices
+    ]
+
+
+def _render_job(job, out_dir, fmt, square_size):
+    name, fen, move_uci, player_color = job
+    path = os.path.join(out_dir, f"{name}.{fmt}")
+    move = chess.Move.from_uci(move_uci) if move_uci else None
+    render = render_png if fmt == "png" else render_svg
+    return render(chess.Board(fen), path, move, player_color, square_size)
+
+
+def _render_chunk(jobs, out_dir, fmt, square_size):
+    return [_render_job(job, out_dir, fmt, square_size) for job in jobs]
+
+
+def export_boards(jobs, out_dir, fmt="png", square_size=60, workers=None, chunk_size=64):
+    """
+    Renders many jobs (see mistake_jobs) into out_dir using a process pool.
+    Each worker imports pygame and builds the sprite atlas once, then draws its
+    jobs in chunks. Returns the written paths in job order.
+    """
+    if fmt not in ("png", "svg"):
+        raise ValueError(f"Unknown image format: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = list(jobs)
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        return [path for chunk in chunks for path in _render_chunk(chunk, out_dir, fmt, square_size)]
+    paths = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_render_chunk, chunk, out_dir, fmt, square_size) for chunk in chunks]
+        for future in futures:
+            paths.extend(future.result())
+    return paths
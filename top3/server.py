@@ -0,0 +1,218 @@
+"""
+Optional local HTTP analysis service.
+
+    python -m top3.server --stockfish /usr/bin/stockfish --engines 4 --port 8765
+
+POST /analyse with a JSON body {"pgn": "...", "username": "..."} returns the game's
+mistakes and accuracy as JSON. GET /health reports the queue. Games are analysed on a
+shared pool of warm engines; identical games (by move list) submitted while one is
+being analysed, or already analysed, share a single analysis.
+"""
+import argparse
+import asyncio
+import io
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import chess.pgn
+
+from top3.core import analyse_plies, game_hash, get_player_color, pgn_parser
+from top3.engines import EnginePool
+from top3.memory import approximate_size, current_rss_mb, peak_rss_mb
+
+MAX_BODY = 1024 * 1024
+
+
+def result_payload(color, mistakes, accuracy):
+    """JSON-friendly form of find_mistakes' result."""
+    return {
+        "color": color,
+        "accuracy": accuracy,
+        "mistakes": {
+            key: [
+                {"move_number": move_number, "move": move, "eval": eval_score, "change": change}
+                for move_number, move, eval_score, change in entries
+            ]
+            for key, entries in mistakes.items()
+        },
+    }
+
+
+class AnalysisService:
+    """
+    Queues analysis requests onto an EnginePool. At most pool.size games are analysed
+    at a time, at most max_queue distinct games may be waiting or running, and the
+    results of the last cache_size games are kept for repeated requests, and with
+    memory_limit no more than that many MB of them (by top3.memory.approximate_size):
+    the least recently used results are dropped first.
+    options are passed on to analyse_plies.
+    """
+    def __init__(self, pool, max_queue=100, cache_size=1000, memory_limit=None, **options):
+        self.pool = pool
+        self.max_queue = max_queue
+        self.cache_size = cache_size
+        self.memory_limit = memory_limit
+        self.executor = ThreadPoolExecutor(max_workers=pool.size)
+        self.semaphore = asyncio.Semaphore(pool.size)
+        self.inflight = {}
+        self.results = OrderedDict()
+        self.result_sizes = {}
+        self.result_bytes = 0
+        self.options = options
+
+    def _remember(self, key, payload):
+        """Keeps payload for repeated requests, dropping the oldest results beyond the limits."""
+        size = approximate_size(payload)
+        self.results[key] = payload
+        self.result_sizes[key] = size
+        self.result_bytes += size
+        limit = self.memory_limit * 1024 * 1024 if self.memory_limit else None
+        while self.results and (len(self.results) > self.cache_size or (limit and self.result_bytes > limit)):
+            old, _ = self.results.popitem(last=False)
+            self.result_bytes -= self.result_sizes.pop(old)
+
+    def _analyse_blocking(self, game, color):
+        with self.pool.engine() as engine:
+            record = analyse_plies(game, color, engine, **self.options)
+        return result_payload(color, record.mistakes(), record.accuracy())
+
+    async def _run(self, key, game, color):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self.semaphore:
+                payload = await loop.run_in_executor(self.executor, self._analyse_blocking, game, color)
+            self._remember(key, payload)
+            return payload
+        finally:
+            del self.inflight[key]
+
+    @staticmethod
+    def _prepare(pgn_string, username):
+        """
+        Validates and parses a request's PGN. Returns (error, game, color, key), error
+        being None or the (HTTP status, JSON payload) to answer with instead.
+        """
+        is_valid, message = pgn_parser(pgn_string)
+        if not is_valid:
+            return (HTTPStatus.BAD_REQUEST, {"error": message}), None, None, None
+        color = get_player_color(pgn_string, username)
+        if color is None:
+            return (HTTPStatus.NOT_FOUND, {"error": f"Username '{username}' not found in PGN."}), None, None, None
+        game = chess.pgn.read_game(io.StringIO(pgn_string))
+        return None, game, color, (game_hash(game), color)
+
+    async def analyse(self, pgn_string, username):
+        """Returns (HTTP status, JSON payload) for one request."""
+        loop = asyncio.get_running_loop()
+        # Parsing a large PGN must not hold up the other connections either
+        error, game, color, key = await loop.run_in_executor(None, self._prepare, pgn_string, username)
+        if error is not None:
+            return error
+        if key in self.results:
+            self.results.move_to_end(key)
+            return HTTPStatus.OK, self.results[key]
+        task = self.inflight.get(key)
+        if task is None:
+            if len(self.inflight) >= self.max_queue:
+                return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Analysis queue is full, try again later."}
+            task = asyncio.ensure_future(self._run(key, game, color))
+            self.inflight[key] = task
+        try:
+            # shield: one client disconnecting must not cancel a shared analysis
+            return HTTPStatus.OK, await asyncio.shield(task)
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Analysis failed: {e}"}
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {
+                "queued": len(self.inflight),
+                "engines": self.pool.size,
+                "cached": len(self.results),
+                "cached_mb": self.result_bytes / (1024 * 1024),
+                "rss_mb": current_rss_mb(),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+        if method == "POST" and path == "/analyse":
+            try:
+                request = json.loads(body)
+                pgn_string = request["pgn"]
+                username = request["username"]
+            except (ValueError, KeyError, TypeError):
+                return HTTPStatus.BAD_REQUEST, {"error": "Expected JSON with 'pgn' and 'username'."}
+            if not isinstance(pgn_string, str) or not isinstance(username, str):
+                return HTTPStatus.BAD_REQUEST, {"error": "'pgn' and 'username' must be strings."}
+            return await self.analyse(pgn_string, username)
+        return HTTPStatus.NOT_FOUND, {"error": f"No route for {method} {path}"}
+
+    async def handle(self, reader, writer):
+        """Serves one HTTP/1.1 request per connection."""
+        try:
+            request_line = await reader.readline()
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, value = line.decode("latin-1").split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY:
+                status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request too large"}
+            else:
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self.route(method, path, body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = HTTPStatus.BAD_REQUEST, {"error": "Bad request"}
+        except Exception as e:
+            # Every client gets an answer, whatever went wrong
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Internal error: {e}"}
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(stockfish_path, host="127.0.0.1", port=8765, engines=2, max_queue=100, engine_options=None,
+                cache_size=1000, memory_limit=None, **options):
+    with EnginePool(stockfish_path, engines, engine_options) as pool:
+        service = AnalysisService(pool, max_queue, cache_size, memory_limit, **options)
+        server = await asyncio.start_server(service.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Top 3 Chess Mistakes analysis service")
+    parser.add_argument("--stockfish", required=True, help="Path to the Stockfish executable")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--engines", type=int, default=2, help="Number of warm engines in the pool")
+    parser.add_argument("--max-queue", type=int, default=100, help="Most games waiting or running at once")
+    parser.add_argument("--cache-size", type=int, default=1000, help="Results of this many games kept for repeats")
+    parser.add_argument("--memory-limit", type=float,
+                        help="MB of cached results to keep; the least recently used are dropped beyond it")
+    parser.add_argument("--hash", type=int, default=256, help="Hash table size in MB of each engine")
+    parser.add_argument("--continuation", action="store_true",
+                        help="Send positions as start position + moves and keep the hash for the whole game")
+    parser.add_argument("--deadline", type=float, help="Seconds to spend on each game, shared out over its plies")
+    args = parser.parse_args()
+    asyncio.run(serve(
+        args.stockfish, args.host, args.port, args.engines, args.max_queue,
+        engine_options={"Hash": args.hash}, cache_size=args.cache_size, memory_limit=args.memory_limit,
+        continuation=args.continuation, deadline=args.deadline,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Piece sprites for the pygame screens. Unlike the rest of the package this module
+imports pygame, so only import it from GUI or image export code.
+"""
+import os
+
+import pygame
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+PIECE_KEYS = [color + piece for color in "wb" for piece in "rnbqkp"]
+
+# square size -> {"atlas": Surface, "images": {piece key: subsurface}, "converted": bool}
+_ATLASES = {}
+
+
+def _cache_path(cache_dir, square_size):
+    return os.path.join(cache_dir, f"pieces_{square_size}.png")
+
+
+def _cache_is_fresh(path, assets_dir):
+    if not os.path.exists(path):
+        return False
+    cache_time = os.path.getmtime(path)
+    return all(
+        os.path.getmtime(os.path.join(assets_dir, f"{key}.png")) <= cache_time for key in PIECE_KEYS
+    )
+
+
+def build_atlas(square_size, assets_dir=ASSETS_DIR, cache_dir=None):
+    """
+    Returns one surface holding all 12 pieces scaled to square_size, side by side in
+    PIECE_KEYS order. With cache_dir the scaled atlas is written to / read from a PNG
+    there, so the per-piece loading and scaling is skipped on later runs.
+    """
+    if cache_dir is not None:
+        path = _cache_path(cache_dir, square_size)
+        if _cache_is_fresh(path, assets_dir):
+            return pygame.image.load(path)
+    atlas = pygame.Surface((square_size * len(PIECE_KEYS), square_size), pygame.SRCALPHA)
+    for i, key in enumerate(PIECE_KEYS):
+        img = pygame.image.load(os.path.join(assets_dir, f"{key}.png"))
+        scaled = pygame.transform.scale(img, (square_size, square_size))
+        # Copy pixels and alpha as they are onto the empty atlas instead of blending
+        atlas.blit(scaled, (i * square_size, 0), special_flags=pygame.BLEND_RGBA_MAX)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        pygame.image.save(atlas, path)
+    return atlas
+
+
+def piece_images(square_size, assets_dir=ASSETS_DIR, cache_dir=None):
+    """
+    Returns {"wp": Surface, ..., "bk": Surface} for the given square size.
+    The atlas is built once per size and reused on every later call; once a display
+    mode is set it is converted to the display's pixel format so blits take the fast path.
+    """
+    entry = _ATLASES.get(square_size)
+    if entry is None:
+        atlas = build_atlas(square_size, assets_dir, cache_dir)
+        entry = {"atlas": atlas, "images": None, "converted": False}
+        _ATLASES[square_size] = entry
+    if not entry["converted"] and pygame.display.get_surface() is not None:
+        entry["atlas"] = entry["atlas"].convert_alpha()
+        entry["images"] = None
+        entry["converted"] = True
+    if entry["images"] is None:
+        entry["images"] = {
+            key: entry["atlas"].subsurface(pygame.Rect(i * square_size, 0, square_size, square_size))
+            for i, key in enumerate(PIECE_KEYS)
+        }
+    return entry["images"]
+
+
+def clear_cache():
+    """Drops the in-memory atlases, e.g. after pygame.quit() in long-running processes."""
+    _ATLASES.clear()
@@ -0,0 +1,115 @@
+import numpy as np
+
+from top3.record import COLUMNS, PHASE_NAMES, eval_changes
+
+
+def archive_arrays(records):
+    """
+    Concatenates the columns of many GameRecords (e.g. a player's whole archive) into
+    single arrays, so statistics for every game can be computed in one vectorised pass.
+    Besides the record columns the result holds:
+    - sign: +1 on plies of games analysed for White, -1 for Black
+    - move_number: full move number of each ply
+    - game: index of the game each ply belongs to
+    - offsets: game i covers plies offsets[i]:offsets[i + 1]
+    """
+    lengths = np.array([len(record) for record in records], dtype=np.int64)
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    arrays = {}
+    for name, dtype in COLUMNS.items():
+        arrays[name] = np.concatenate([np.zeros(0, dtype)] + [getattr(r, name) for r in records])
+    signs = np.array([record.sign() for record in records], dtype=np.int8)
+    arrays["sign"] = np.repeat(signs, lengths)
+    arrays["move_number"] = np.concatenate(
+        [np.zeros(0, np.int32)] + [record.move_numbers() for record in records]
+    )
+    arrays["game"] = np.repeat(np.arange(len(records), dtype=np.int32), lengths)
+    arrays["offsets"] = offsets
+    return arrays
+
+
+def mistake_masks(arrays, thresholds):
+    """
+    Returns (masks, changes): masks[i, k] is True if ply i is a mistake by the analysed
+    player under thresholds[k], using the same rule as GameRecord.mistake_mask.
+    """
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+    candidates, changes = _candidates(arrays)
+    masks = candidates[:, None] & (changes[:, None] < -thresholds[None, :])
+    return masks, changes
+
+
+def _candidates(arrays):
+    """Plies that can be mistakes at any threshold, and the change in eval of every ply."""
+    offsets = arrays["offsets"]
+    starts = offsets[:-1][offsets[:-1] < len(arrays["ply"])]
+    _, changes, is_mate = eval_changes(arrays["score"], arrays["mate"], arrays["sign"], starts)
+    player = arrays["side"] == (arrays["sign"] > 0)
+    candidates = player & (arrays["played"] != arrays["best"]) & ~is_mate & (changes < 0)
+    return candidates, changes
+
+
+def _moves_per_game(arrays):
+    offsets = arrays["offsets"]
+    moves = np.zeros(len(offsets) - 1)
+    played = offsets[1:] > offsets[:-1]
+    moves[played] = arrays["move_number"][offsets[1:][played] - 1]
+    return moves
+
+
+def threshold_sweep(arrays, thresholds, phases=None):
+    """
+    Computes accuracy and mistake counts of every game under every threshold at once.
+    phases optionally replaces the stored phase column (see top3.phase) to regroup
+    mistakes under different phase rules without re-running the engine.
+    Returns a dict with:
+    - accuracy: (games, thresholds) array
+    - mistakes: (games, thresholds, 3) array of counts per phase, in PHASE_NAMES order
+    """
+    if phases is None:
+        phases = arrays["phase"]
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.float64))
+    games = len(arrays["offsets"]) - 1
+    k = len(thresholds)
+    candidates, changes = _candidates(arrays)
+    # Only the plies that lose evaluation take part, as a (plies, thresholds) grid
+    plies = np.flatnonzero(candidates)
+    drops = -changes[plies]
+    masks = drops[:, None] > thresholds[None, :]
+    slots = arrays["game"][plies].astype(np.int64)[:, None] * k + np.arange(k)
+    penalties = np.broadcast_to(np.minimum(drops, 1.0)[:, None], masks.shape)
+    total_penalty = np.bincount(
+        slots[masks], weights=penalties[masks], minlength=games * k
+    ).reshape(games, k)
+    moves = _moves_per_game(arrays)
+    accuracy = np.ones_like(total_penalty)
+    played = moves > 0
+    accuracy[played] = np.maximum(0.0, 1 - total_penalty[played] / moves[played, None])
+    phase_slots = slots * len(PHASE_NAMES) + phases[plies].astype(np.int64)[:, None]
+    mistakes = np.bincount(
+        phase_slots[masks], minlength=games * k * len(PHASE_NAMES)
+    ).reshape(games, k, len(PHASE_NAMES))
+    return {"accuracy": accuracy, "mistakes": mistakes}
+
+
+def accuracy(arrays, threshold=0.2):
+    """Accuracy of every game, as find_mistakes computes it for one game."""
+    return threshold_sweep(arrays, threshold)["accuracy"][:, 0]
+
+
+def mistake_counts(arrays, threshold=0.2, phases=None):
+    """(games, 3) array of mistake counts per phase (opening, middlegame, endgame)."""
+    return threshold_sweep(arrays, threshold, phases)["mistakes"][:, 0, :]
+
+
+def archive_summary(arrays, threshold=0.2, phases=None):
+    """Archive-wide totals: number of games, mean accuracy and mistakes per phase."""
+    sweep = threshold_sweep(arrays, threshold, phases)
+    games = len(arrays["offsets"]) - 1
+    totals = sweep["mistakes"][:, 0, :].sum(axis=0)
+    return {
+        "games": games,
+        "accuracy": float(sweep["accuracy"][:, 0].mean()) if games else 1.0,
+        "mistakes": {name: int(totals[p]) for p, name in enumerate(PHASE_NAMES)},
+    }
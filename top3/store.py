@@ -0,0 +1,188 @@
+"""
+Compact binary store for analysed archives.
+
+A store is two files of fixed-width records after a 16 byte header:
+- <path>.plies: one PLY_DTYPE record per analysed ply, games stored one after the other
+- <path>.games: one GAME_DTYPE record per game, pointing at its range of plies
+Both are opened with numpy.memmap, so multi-GB result sets open instantly and the
+statistics in top3.stats scan them without parsing PGN or JSON or copying columns.
+"""
+import os
+import struct
+
+import chess
+import chess.polyglot
+import numpy as np
+
+from top3.record import COLUMNS, GameRecord, decode_move
+
+MAGIC = b"TOP3STOR"
+VERSION = 1
+HEADER_SIZE = 16
+
+PLY_DTYPE = np.dtype([
+    ("position", "<u8"),  # Zobrist hash of the position before the move
+    ("score", "<i4"),
+    ("ply", "<u2"),
+    ("mate", "<i2"),
+    ("best", "<u2"),
+    ("played", "<u2"),
+    ("side", "u1"),
+    ("phase", "u1"),
+])
+
+GAME_DTYPE = np.dtype([
+    ("key", "S20"),        # game_hash as raw SHA-1 bytes
+    ("first", "<u8"),      # index of the game's first ply in the plies file
+    ("count", "<u4"),      # number of plies
+    ("fullmove", "<u2"),   # full move number of the starting position
+    ("black_first", "u1"), # 1 if Black made the first move
+    ("color", "u1"),       # 1 if analysed for White, 0 for Black
+    ("start_fen", "S92"),
+])
+
+
+def table_header(dtype):
+    """The 16 byte header starting a table file of dtype records."""
+    return MAGIC + struct.pack("<II", VERSION, dtype.itemsize)
+
+
+def open_table(path, dtype, mode="r"):
+    """Memory-maps a table file; returns an empty array for a missing or empty table."""
+    if not os.path.exists(path) or os.path.getsize(path) <= HEADER_SIZE:
+        return np.zeros(0, dtype)
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if header[:8] != MAGIC:
+        raise ValueError(f"{path} is not a top3 store file")
+    version, itemsize = struct.unpack("<II", header[8:])
+    if version != VERSION or itemsize != dtype.itemsize:
+        raise ValueError(f"{path} has an unsupported store format (version {version})")
+    count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    return np.memmap(path, dtype=dtype, mode=mode, offset=HEADER_SIZE, shape=(count,))
+
+
+def append_table(path, dtype, count):
+    """
+    Opens a table file for appending after its first count records: a new (or torn
+    header) file gets a header, and anything past those records, such as a row cut
+    short by an interrupted write, is dropped so the next rows are appended in line.
+    """
+    f = open(path, "ab")
+    if os.path.getsize(path) < HEADER_SIZE:
+        f.truncate(0)
+        f.write(table_header(dtype))
+    else:
+        f.truncate(HEADER_SIZE + count * dtype.itemsize)
+    return f
+
+
+def position_hashes(record):
+    """Zobrist hash of the position before each ply of a GameRecord."""
+    board = chess.Board(record.start_fen)
+    hashes = np.empty(len(record), dtype=np.uint64)
+    for i, value in enumerate(record.played):
+        hashes[i] = chess.polyglot.zobrist_hash(board)
+        board.push(decode_move(value))
+    return hashes
+
+
+class StoreWriter:
+    """
+    Appends GameRecords to a store, creating its files on first use.
+    Each game is stored once: adding a key already in the store does nothing.
+    """
+    def __init__(self, path):
+        self.path = path
+        games = open_table(path + ".games", GAME_DTYPE)
+        self.next_ply = int(games["first"][-1] + games["count"][-1]) if len(games) else 0
+        # Plies written after the last complete game (e.g. interrupted write) are dropped
+        self.files = {
+            ".plies": append_table(path + ".plies", PLY_DTYPE, self.next_ply),
+            ".games": append_table(path + ".games", GAME_DTYPE, len(games)),
+        }
+        # numpy strips trailing NUL bytes from S20 values, so pad them back
+        self.keys = {key.ljust(20, b"\0") for key in games["key"].tolist()}
+
+    def add(self, record, key):
+        """
+        Appends record under key, the game's game_hash (hex string).
+        Returns False if the game was already in the store.
+        """
+        if bytes.fromhex(key) in self.keys:
+            return False
+        plies = np.zeros(len(record), dtype=PLY_DTYPE)
+        for name in COLUMNS:
+            plies[name] = getattr(record, name)
+        plies["position"] = position_hashes(record)
+        board = chess.Board(record.start_fen)
+        game = np.zeros(1, dtype=GAME_DTYPE)
+        game["key"] = bytes.fromhex(key)
+        game["first"] = self.next_ply
+        game["count"] = len(record)
+        game["fullmove"] = board.fullmove_number
+        game["black_first"] = board.turn == chess.BLACK
+        game["color"] = record.color == "white"
+        game["start_fen"] = record.start_fen.encode()
+        # Plies first: a game row only ever points at plies already on disk
+        self.files[".plies"].write(plies.tobytes())
+        self.files[".plies"].flush()
+        self.files[".games"].write(game.tobytes())
+        self.files[".games"].flush()
+        self.next_ply += len(record)
+        self.keys.add(bytes.fromhex(key))
+        return True
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Store:
+    """Read-only, memory-mapped view of a store."""
+    def __init__(self, path):
+        self.games = open_table(path + ".games", GAME_DTYPE)
+        plies = open_table(path + ".plies", PLY_DTYPE)
+        end = int(self.games["first"][-1] + self.games["count"][-1]) if len(self.games) else 0
+        self.plies = plies[:end]
+
+    def __len__(self):
+        return len(self.games)
+
+    def record(self, i):
+        """GameRecord of game i, its columns being views into the mapped file."""
+        game = self.games[i]
+        plies = self.plies[int(game["first"]):int(game["first"]) + int(game["count"])]
+        columns = {name: plies[name] for name in COLUMNS}
+        color = "white" if game["color"] else "black"
+        return GameRecord(columns, color, game["start_fen"].decode())
+
+    def find(self, key):
+        """Index of the game with game_hash key, or None."""
+        matches = np.flatnonzero(self.games["key"] == bytes.fromhex(key))
+        return int(matches[0]) if len(matches) else None
+
+    def archive_arrays(self):
+        """
+        The same arrays as top3.stats.archive_arrays for every game in the store.
+        Record columns are zero-copy views of the mapped plies file.
+        """
+        games = self.games
+        lengths = games["count"].astype(np.int64)
+        offsets = np.zeros(len(games) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        arrays = {name: self.plies[name] for name in COLUMNS}
+        arrays["position"] = self.plies["position"]
+        arrays["sign"] = np.repeat(np.where(games["color"] == 1, 1, -1).astype(np.int8), lengths)
+        arrays["game"] = np.repeat(np.arange(len(games), dtype=np.int32), lengths)
+        first_ply = np.repeat(games["black_first"].astype(np.int32), lengths)
+        fullmove = np.repeat(games["fullmove"].astype(np.int32), lengths)
+        arrays["move_number"] = fullmove + (self.plies["ply"].astype(np.int32) + first_ply) // 2
+        arrays["offsets"] = offsets
+        return arrays